@@ -0,0 +1,100 @@
+import json
+import os
+import platform
+import time
+from array import array
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "prime_autotune.json")
+# Numbers timed per calibration run, taken evenly across the dataset
+CALIBRATION_SAMPLE_SIZE = 100_000
+# Each candidate keeps its best time of this many runs
+CALIBRATION_REPEATS = 2
+
+def host_key():
+    return f"{platform.node()}/{os.cpu_count()}cpu"
+
+def calibration_sample(numbers, size=CALIBRATION_SAMPLE_SIZE):
+    """An evenly strided sample of numbers, so it has the dataset's value mix."""
+    stride = max(1, len(numbers) // size)
+    return array('q', (numbers[i] for i in range(0, len(numbers), stride)))[:size]
+
+def dataset_profile(sample, count):
+    """Coarse dataset shape used to key the cache: size and largest value, as powers of two."""
+    largest = max(sample, default=0)
+    return f"n~2^{count.bit_length()},max~2^{int(largest).bit_length()}"
+
+def load_cache(path=DEFAULT_CACHE_PATH):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def save_cache(cache, path=DEFAULT_CACHE_PATH):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(cache, file, indent=2)
+    os.replace(tmp_path, path)
+
+def search(space, start, measure):
+    """
+    Coordinate descent over space (parameter -> candidates): starting from
+    start, try every candidate of one parameter with the others fixed, keep
+    the fastest, then move to the next parameter. Much cheaper than the full
+    grid and good enough here since the parameters interact weakly.
+    Returns (best config, its seconds).
+    """
+    best = dict(start)
+    timings = {}
+
+    def timed(config):
+        key = tuple(sorted(config.items()))
+        if key not in timings:
+            timings[key] = min(measure(config) for _ in range(CALIBRATION_REPEATS))
+        return timings[key]
+
+    best_time = timed(best)
+    for name, candidates in space.items():
+        for value in candidates:
+            config = {**best, name: value}
+            seconds = timed(config)
+            if seconds < best_time:
+                best, best_time = config, seconds
+    return best, best_time
+
+def autotune(kind, numbers, space, default, run, cache_path=DEFAULT_CACHE_PATH, retune=False):
+    """
+    Return the fastest configuration of kind for numbers on this host.
+    A cached winner for the same host and dataset profile is reused;
+    otherwise run(sample, config) -> seconds is timed on a calibration
+    sample for each configuration tried and the winner is cached.
+    """
+    sample = calibration_sample(numbers)
+    key = f"{host_key()}|{kind}|{dataset_profile(sample, len(numbers))}"
+    cache = load_cache(cache_path)
+    if not retune and key in cache:
+        return cache[key]["config"]
+
+    print(f"Auto-tuning {kind} on a {len(sample)}-number calibration sample...")
+    start = time.perf_counter()
+    config, seconds = search(space, default, lambda config: run(sample, config))
+    print(f"  Best: {config} ({seconds / max(len(sample), 1) * 1e6:.2f} µs/number, "
+          f"tuned in {time.perf_counter() - start:.1f} seconds)")
+    cache = load_cache(cache_path)
+    cache[key] = {"config": config, "seconds_per_number": seconds / max(len(sample), 1),
+                  "tuned_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    save_cache(cache, cache_path)
+    return config
+
+def best_known(kind, cache_path=DEFAULT_CACHE_PATH):
+    """The most recently tuned configuration of kind on this host, or None."""
+    prefix = f"{host_key()}|{kind}|"
+    entries = [entry for key, entry in load_cache(cache_path).items() if key.startswith(prefix)]
+    if not entries:
+        return None
+    return max(entries, key=lambda entry: entry["tuned_at"])["config"]
+
+def powers_of_two_up_to(limit):
+    """1, 2, 4, ... up to limit, plus limit itself."""
+    return sorted({1 << i for i in range(limit.bit_length()) if 1 << i <= limit} | {limit})
@@ -0,0 +1,242 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import multiprocessing as mp
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from collections import namedtuple
+
+from dataset import load_dataset
+from parallel import WorkerPool, share_numbers
+import escenarioBase_1proceso as baseline
+import program2_threads
+import program3_processes
+import program4_hybrid
+import server
+
+STRATEGIES = ('baseline', 'threads', 'processes', 'hybrid', 'distributed')
+DEFAULT_REPEATS = 5
+DEFAULT_WARMUP = 1
+# A strategy regresses when its median is this much slower than the saved baseline
+DEFAULT_TOLERANCE = 0.10
+# Numbers per work unit in distributed runs
+DISTRIBUTED_UNIT_SIZE = 100_000
+
+# One benchmarked configuration. run() returns (prime count, seconds); most
+# strategies are timed around the call, distributed runs report job wall time.
+Case = namedtuple('Case', 'name strategy workers run')
+
+def timed(fn, *args, **kwargs):
+    """Call fn and return (its result, perf_counter seconds)."""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of values."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def summarize(times):
+    return {
+        "median": statistics.median(times),
+        "p95": percentile(times, 0.95),
+        "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "min": min(times),
+        "max": max(times),
+        "times": times,
+    }
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+@contextlib.contextmanager
+def daemon_clients(num_clients, processes, port):
+    """Run local client.py daemons that reconnect for every distributed trial."""
+    client_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'client.py')
+    command = [sys.executable, client_path, '--host', '127.0.0.1', '--port', str(port),
+               '--processes', str(processes), '--daemon']
+    clients = [subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+               for _ in range(num_clients)]
+    try:
+        yield clients
+    finally:
+        for client in clients:
+            client.terminate()
+        for client in clients:
+            client.wait()
+
+def run_distributed(numbers, port):
+    """One distributed job over localhost; returns (primes, job wall-clock seconds)."""
+    units = (numbers[i:i + DISTRIBUTED_UNIT_SIZE] for i in range(0, len(numbers), DISTRIBUTED_UNIT_SIZE))
+    with contextlib.redirect_stdout(io.StringIO()):
+        queue, _, wall_time = asyncio.run(server.run_job(units, '127.0.0.1', port))
+    return sum(primes for primes, _ in queue.results.values()), wall_time
+
+def parse_hybrid(spec):
+    """Parse 'PxT' into (processes, threads)."""
+    processes, threads = spec.lower().split('x')
+    return int(processes), int(threads)
+
+def build_cases(args, numbers, stack):
+    """Create the benchmark cases; pools and clients they need are entered on stack."""
+    strategies = args.strategies.split(',')
+    cases = []
+    if 'baseline' in strategies:
+        cases.append(Case('baseline', 'baseline', 1, lambda: timed(baseline.contar_primos, numbers)))
+    if 'threads' in strategies:
+        # The same pure-Python kernel as the other strategies, so speedups compare like with like
+        for n in args.workers:
+            cases.append(Case(f'threads-{n}', 'threads', n,
+                              lambda n=n: timed(program2_threads.count_primes_with_threadpool, numbers, n,
+                                                backend='python')))
+    if 'processes' in strategies or 'hybrid' in strategies:
+        # Share the data once and keep the pool warm, so only compute is timed
+        shared = stack.enter_context(share_numbers(numbers))
+        pool = stack.enter_context(WorkerPool())
+        # Start the largest pool once; each case only limits its concurrency
+        sizes = [*args.workers] if 'processes' in strategies else []
+        if 'hybrid' in strategies:
+            sizes += [p for p, _ in map(parse_hybrid, args.hybrid.split(','))]
+        pool.resize(max(sizes))
+
+        def on_pool(size, fn, *fn_args, **fn_kwargs):
+            pool.resize(size)
+            return timed(fn, shared, *fn_args, executor=pool.executor, **fn_kwargs)
+    if 'processes' in strategies:
+        for n in args.workers:
+            cases.append(Case(f'processes-{n}', 'processes', n,
+                              lambda n=n: on_pool(n, program3_processes.count_primes_with_processpool, n)))
+    if 'hybrid' in strategies:
+        for p, t in map(parse_hybrid, args.hybrid.split(',')):
+            cases.append(Case(f'hybrid-{p}x{t}', 'hybrid', p * t,
+                              lambda p=p, t=t: on_pool(p, program4_hybrid.count_primes_hybrid, p, t)))
+    if 'distributed' in strategies and args.clients:
+        port = free_port()
+        stack.enter_context(daemon_clients(args.clients, args.client_processes, port))
+        cases.append(Case(f'distributed-{args.clients}x{args.client_processes}', 'distributed',
+                          args.clients * args.client_processes, lambda: run_distributed(numbers, port)))
+    return cases
+
+def run_case(case, warmup, repeats):
+    """Warm up, then time repeats trials; returns (prime counts seen, timing summary)."""
+    for _ in range(warmup):
+        case.run()
+    counts = set()
+    times = []
+    for _ in range(repeats):
+        count, seconds = case.run()
+        counts.add(count)
+        times.append(seconds)
+    return counts, summarize(times)
+
+def compare(results, baseline_results, tolerance):
+    """Return the names of cases whose median regressed against the saved baseline."""
+    saved = {result["name"]: result for result in baseline_results}
+    regressions = []
+    print(f"\nComparison with saved baseline (tolerance {tolerance:.0%}):")
+    print("Case                 | Saved (s) | Now (s)  | Change   | Status")
+    print("-" * 66)
+    for result in results:
+        before = saved.get(result["name"])
+        if before is None:
+            continue
+        change = result["median"] / before["median"] - 1
+        status = "REGRESSION" if change > tolerance else "ok"
+        if status != "ok":
+            regressions.append(result["name"])
+        print(f"{result['name']:<20} | {before['median']:^9.4f} | {result['median']:^8.4f} | "
+              f"{change:^+8.1%} | {status}")
+    return regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark every execution strategy on the same dataset.")
+    parser.add_argument("data_file", help="CSV or binary dataset")
+    parser.add_argument("--strategies", default=",".join(STRATEGIES),
+                        help="comma-separated strategies to run")
+    parser.add_argument("--workers", default=None,
+                        help="comma-separated thread/process counts (default: 1, 2, 4, ... up to the CPU count)")
+    parser.add_argument("--hybrid", default="2x2", help="comma-separated PROCESSESxTHREADS configurations")
+    parser.add_argument("--clients", type=int, default=2, help="local daemon clients for distributed runs (0 skips)")
+    parser.add_argument("--client-processes", type=int, default=1, help="pool processes per distributed client")
+    parser.add_argument("--warmup", type=int, default=DEFAULT_WARMUP, help="untimed runs per case")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS, help="timed runs per case")
+    parser.add_argument("--json", metavar="PATH", help="write the results as JSON")
+    parser.add_argument("--compare", metavar="PATH", help="saved JSON results to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed median slowdown before a case is flagged")
+    args = parser.parse_args()
+    if args.workers is None:
+        cpus = mp.cpu_count()
+        args.workers = sorted({1 << i for i in range(cpus.bit_length())} | {cpus})
+    else:
+        args.workers = [int(n) for n in args.workers.split(',')]
+    return args
+
+def main():
+    args = parse_args()
+    numbers = load_dataset(args.data_file)
+    print(f"Benchmarking {len(numbers)} numbers from {args.data_file} "
+          f"({args.warmup} warm-up, {args.repeats} timed runs per case)")
+
+    results = []
+    with contextlib.ExitStack() as stack:
+        for case in build_cases(args, numbers, stack):
+            print(f"Running {case.name}...")
+            counts, summary = run_case(case, args.warmup, args.repeats)
+            results.append({"name": case.name, "strategy": case.strategy, "workers": case.workers,
+                            "primes": sorted(counts), **summary})
+
+    # Speedup and efficiency are relative to the single-process baseline when it ran
+    reference = next((r["median"] for r in results if r["strategy"] == "baseline"), results[0]["median"])
+    print("\nCase                 | Workers | Median (s) | p95 (s)  | Stdev (s) | Speedup | Efficiency")
+    print("-" * 90)
+    for result in results:
+        result["speedup"] = reference / result["median"]
+        result["efficiency"] = result["speedup"] / result["workers"]
+        print(f"{result['name']:<20} | {result['workers']:^7d} | {result['median']:^10.4f} | "
+              f"{result['p95']:^8.4f} | {result['stdev']:^9.4f} | {result['speedup']:^6.2f}x | "
+              f"{result['efficiency']:^10.1%}")
+
+    prime_counts = {count for result in results for count in result["primes"]}
+    if len(prime_counts) != 1:
+        print(f"Warning: strategies disagree on the prime count: {sorted(prime_counts)}")
+    else:
+        print(f"All strategies found {prime_counts.pop()} primes")
+
+    if args.json:
+        report = {
+            "dataset": os.path.abspath(args.data_file),
+            "numbers": len(numbers),
+            "cpu_count": mp.cpu_count(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "warmup": args.warmup,
+            "repeats": args.repeats,
+            "results": results,
+        }
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f"Results saved to {args.json}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            saved = json.load(file)
+        regressions = compare(results, saved["results"], args.tolerance)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
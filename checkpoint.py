@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import time
+from collections import namedtuple
+
+from dataset import DEFAULT_CHUNK_SIZE, is_binary_dataset, iter_number_chunks
+
+DEFAULT_CHECKPOINT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "prime_checkpoints")
+# Bytes hashed at each end of the processed prefix to detect a rewritten file
+FINGERPRINT_BYTES = 1 << 16
+# Bytes read per step when looking backwards for the last delimiter
+SCAN_BLOCK_SIZE = 1 << 16
+
+# Outcome of an incremental run: totals for the whole file, the bytes that
+# were actually read and whether a checkpoint was resumed
+IncrementalResult = namedtuple('IncrementalResult', 'primes numbers new_bytes resumed')
+
+def checkpoint_path(file_path, checkpoint_dir=DEFAULT_CHECKPOINT_DIR):
+    """Checkpoint file for a dataset, named after a hash of its absolute path."""
+    digest = hashlib.sha1(os.path.abspath(file_path).encode()).hexdigest()[:16]
+    return os.path.join(checkpoint_dir, f"{digest}.json")
+
+def fingerprint(file_path, offset):
+    """
+    Hash of the first and last FINGERPRINT_BYTES of the first offset bytes.
+    Appending leaves it unchanged; truncating or rewriting the processed
+    part changes it (edits in the middle of a large prefix are not seen).
+    """
+    digest = hashlib.blake2b(str(offset).encode(), digest_size=16)
+    with open(file_path, 'rb') as file:
+        digest.update(file.read(min(offset, FINGERPRINT_BYTES)))
+        tail_start = max(FINGERPRINT_BYTES, offset - FINGERPRINT_BYTES)
+        if tail_start < offset:
+            file.seek(tail_start)
+            digest.update(file.read(offset - tail_start))
+    return digest.hexdigest()
+
+def load_checkpoint(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+def save_checkpoint(path, checkpoint):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(checkpoint, file, indent=2)
+    os.replace(tmp_path, path)
+
+def complete_fields_end(file_path, start, size):
+    """
+    Offset just past the last comma or newline in [start, size), or start if
+    there is none. A trailing field without a delimiter may still be growing.
+    """
+    with open(file_path, 'rb') as file:
+        end = size
+        while end > start:
+            block_start = max(start, end - SCAN_BLOCK_SIZE)
+            file.seek(block_start)
+            block = file.read(end - block_start)
+            cut = max(block.rfind(b','), block.rfind(b'\n'))
+            if cut != -1:
+                return block_start + cut + 1
+            end = block_start
+    return start
+
+def _counted(chunks, sizes):
+    """Pass chunks through, appending each one's length to sizes."""
+    for chunk in chunks:
+        sizes.append(len(chunk))
+        yield chunk
+
+def count_primes_incremental(file_path, count_chunks, checkpoint_dir=DEFAULT_CHECKPOINT_DIR,
+                             chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Count the primes of a CSV file that keeps growing, reading only what was
+    appended since the last run. count_chunks(chunks) -> primes counts an
+    iterable of number chunks. The checkpoint stores the byte offset of the
+    last complete field, the primes and numbers up to it and a fingerprint of
+    that prefix; if the prefix no longer matches, the whole file is read again.
+    A trailing field without a delimiter is counted but left out of the checkpoint.
+    """
+    if is_binary_dataset(file_path):
+        raise ValueError("Incremental mode needs a CSV file")
+    size = os.path.getsize(file_path)
+    path = checkpoint_path(file_path, checkpoint_dir)
+    saved = load_checkpoint(path)
+    start, primes, numbers = 0, 0, 0
+    resumed = (saved is not None and saved["offset"] <= size
+               and fingerprint(file_path, saved["offset"]) == saved["fingerprint"])
+    if resumed:
+        start, primes, numbers = saved["offset"], saved["primes"], saved["numbers"]
+        print(f"Resuming at byte {start} ({numbers} numbers, {primes} primes); "
+              f"{size - start} new bytes to read")
+    elif saved is not None:
+        print("File changed before the checkpoint; counting it from the start")
+
+    end = complete_fields_end(file_path, start, size)
+    sizes = []
+    primes += count_chunks(_counted(iter_number_chunks(file_path, chunk_size, start=start, end=end), sizes))
+    numbers += sum(sizes)
+    save_checkpoint(path, {"file": os.path.abspath(file_path), "offset": end, "primes": primes,
+                           "numbers": numbers, "fingerprint": fingerprint(file_path, end),
+                           "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S")})
+
+    # The unterminated last field is counted now and read again next time
+    sizes = []
+    partial = count_chunks(_counted(iter_number_chunks(file_path, chunk_size, start=end, end=size), sizes))
+    return IncrementalResult(primes + partial, numbers + sum(sizes), size - start, resumed)
@@ -1,9 +1,34 @@
+import argparse
+import os
 import socket
+import threading
 import time
 import multiprocessing as mp
-import array
 import math
-from typing import List, Set
+from contextlib import ExitStack
+from typing import Sequence
+from primality import (MILLER_RABIN_THRESHOLD, count_primes_sieve,
+                        is_prime_miller_rabin, sieve_is_cheaper)
+from parallel import TASKS_PER_WORKER, balanced_ranges, detach_stale_blocks, share_numbers
+from compression import CODECS, DEFAULT_CODEC, decode_numbers
+from autotune import autotune, best_known, powers_of_two_up_to
+from dataset import load_dataset
+import metrics
+from metrics import measured_call, timed_phase
+from protocol import (HEADER, MSG_DONE, MSG_HEARTBEAT, MSG_HELLO, MSG_REQUEST_WORK, MSG_RESULT, MSG_UNIT_END,
+                      MSG_WORK, pack_heartbeat, pack_hello, pack_result, recv_message, send_message, unpack_hello,
+                      unpack_unit_end, unpack_work)
+
+# Client configuration
+SERVER_HOST = '10.20.20.101'
+SERVER_PORT = 65432
+BUFFER_SIZE = 65536  # Increased buffer size for faster data transfer
+HEARTBEAT_INTERVAL = 5.0  # Seconds between heartbeats
+RECONNECT_BACKOFF_MIN = 1.0  # Seconds before the first reconnect attempt
+RECONNECT_BACKOFF_MAX = 60.0
+# Streamed batch blocks a pool process keeps attached: the batch it works on,
+# plus the previous one whose last tasks may still be queued behind it
+STREAMED_BLOCKS_KEPT = 2
 
 def is_prime(n: int) -> bool:
     """Optimized prime number check using wheel factorization"""
@@ -13,6 +38,9 @@ def is_prime(n: int) -> bool:
         return True
     if n % 2 == 0 or n % 3 == 0:
         return False
+    # Large values: O(log^3 n) Miller-Rabin instead of O(sqrt n) trial division
+    if n >= MILLER_RABIN_THRESHOLD:
+        return is_prime_miller_rabin(n)
     
     # Use wheel factorization (6k ± 1)
     for i in range(5, int(math.sqrt(n)) + 1, 6):
@@ -20,86 +48,268 @@ def is_prime(n: int) -> bool:
             return False
     return True
 
-def process_chunk(start_idx: int, end_idx: int, numbers: array.array) -> int:
+def process_chunk(start_idx: int, end_idx: int, numbers: Sequence[int]) -> int:
     """Process a chunk of numbers using optimized prime checking"""
-    return sum(1 for n in numbers[start_idx:end_idx] if is_prime(n))
+    chunk = numbers[start_idx:end_idx]
+    # Switch to the batch sieve when the value range makes it cheaper
+    if chunk and sieve_is_cheaper(len(chunk), max(chunk)):
+        return count_primes_sieve(chunk)
+    return sum(1 for n in chunk if is_prime(n))
+
+def process_task(task) -> int:
+    """Unpack a (start, end, numbers) task for imap_unordered"""
+    return process_chunk(*task)
+
+def process_streamed_task(task) -> int:
+    """
+    Process a task of a streamed batch. Every batch has its own block, used
+    by all of its tasks; blocks of older batches are detached first, so a
+    process attaches once per batch and keeps few blocks mapped.
+    """
+    detach_stale_blocks(task[2], STREAMED_BLOCKS_KEPT)
+    return process_chunk(*task)
+
+def tune_client(numbers: Sequence[int], retune: bool = False) -> dict:
+    """Pick (and cache) the fastest pool size and tasks per worker for numbers on this host"""
+    space = {
+        "processes": powers_of_two_up_to(mp.cpu_count()),
+        "tasks_per_worker": [1, TASKS_PER_WORKER, 4 * TASKS_PER_WORKER],
+    }
+    default = {"processes": mp.cpu_count(), "tasks_per_worker": TASKS_PER_WORKER}
 
-def parallel_prime_count(numbers: List[int], num_processes: int) -> int:
-    """Count primes using parallel processing with improved chunking"""
+    def run(sample, config):
+        with mp.Pool(processes=config["processes"]) as pool:
+            # Time a warm pool, as the client keeps its pool across units
+            pool.map(int, range(config["processes"]))
+            start_time = time.perf_counter()
+            parallel_prime_count(sample, config["processes"], pool, config["tasks_per_worker"])
+            return time.perf_counter() - start_time
+
+    return autotune("client", numbers, space, default, run, retune=retune)
+
+def parallel_prime_count(numbers: Sequence[int], num_processes: int = None, pool=None,
+                         tasks_per_worker: int = None) -> int:
+    """
+    Count primes using parallel processing with improved chunking (reusing pool if given).
+    Without num_processes, the auto-tuned configuration for this host and dataset is used.
+    """
     if not numbers:
         return 0
+    if num_processes is None:
+        config = tune_client(numbers)
+        num_processes = config["processes"]
+        tasks_per_worker = tasks_per_worker or config["tasks_per_worker"]
+    if pool is None:
+        with mp.Pool(processes=num_processes) as pool:
+            return parallel_prime_count(numbers, num_processes, pool, tasks_per_worker)
     
-    # Convert to array for more efficient memory usage
-    num_array = array.array('i', numbers)
-    chunk_size = math.ceil(len(numbers) / num_processes)
+    # Many small index ranges of similar estimated cost rather than one per process
+    chunks = balanced_ranges(numbers, num_processes * (tasks_per_worker or TASKS_PER_WORKER))
     
-    # Create chunks based on index ranges rather than splitting the array
-    chunks = [
-        (i * chunk_size, min((i + 1) * chunk_size, len(numbers)))
-        for i in range(num_processes)
-    ]
-    
-    # Use process pool for parallel processing
-    with mp.Pool(processes=num_processes) as pool:
-        results = pool.starmap(
-            process_chunk,
-            [(start, end, num_array) for start, end in chunks]
+    # Place the numbers in shared memory once (as 64-bit integers); tasks only carry index ranges
+    with share_numbers(numbers) as shared:
+        # Hand tasks out one at a time so idle processes keep pulling work
+        results = pool.imap_unordered(
+            process_task,
+            [(start, end, shared) for start, end in chunks],
+            chunksize=1
         )
-    
-    return sum(results)
+        return sum(results)
 
-def main():
-    # Client configuration
-    SERVER_HOST = '10.20.20.101'
-    SERVER_PORT = 65432
-    BUFFER_SIZE = 65536  # Increased buffer size for faster data transfer
+def submit_batch(pool, numbers: Sequence[int], num_tasks: int, shared_blocks: ExitStack,
+                 run_metrics=None):
+    """Share one received batch and queue its cost-balanced ranges on the pool right away"""
+    shared = shared_blocks.enter_context(share_numbers(numbers, run_metrics))
+    tasks = [(start, end, shared) for start, end in balanced_ranges(shared, num_tasks)]
+    if run_metrics is None:
+        return [pool.apply_async(process_streamed_task, (task,)) for task in tasks]
+    return [pool.apply_async(measured_call, (process_streamed_task, task, run_metrics.profiling))
+            for task in tasks]
+
+def count_streamed_unit(client_socket: socket.socket, codec: str, pool, num_tasks: int,
+                        run_metrics=None):
+    """
+    Receive one unit batch by batch, submitting each batch to the pool as
+    soon as it is decoded, so transfer and compute overlap.
+    Returns (unit id, primes, numbers, payload bytes, decode seconds), or None when no work is left.
+    """
+    pending = []
+    unit_numbers = 0
+    unit_bytes = 0
+    decode_time = 0.0
+    with ExitStack() as shared_blocks:
+        while True:
+            with timed_phase(run_metrics, 'receive'):
+                msg_type, payload = recv_message(client_socket)
+            if run_metrics is not None:
+                run_metrics.add_bytes('received', HEADER.size + len(payload))
+            if msg_type == MSG_DONE:
+                return None
+            if msg_type == MSG_UNIT_END:
+                unit_id = unpack_unit_end(payload)
+                break
+            if msg_type != MSG_WORK:
+                raise ValueError(f"Expected a work message, got type {msg_type}")
 
-    # Create client socket with optimized settings
+            # Decode the batch straight into 64-bit integers, no text parsing
+            start_time = time.perf_counter()
+            _, encoded = unpack_work(payload)
+            numbers = decode_numbers(encoded, codec)
+            decode_time += time.perf_counter() - start_time
+            unit_bytes += len(payload)
+            unit_numbers += len(numbers)
+            pending.extend(submit_batch(pool, numbers, num_tasks, shared_blocks, run_metrics))
+        # Only the compute still outstanding after the last batch arrived is waited for here
+        with timed_phase(run_metrics, 'compute'):
+            if run_metrics is None:
+                prime_count = sum(result.get() for result in pending)
+            else:
+                prime_count = sum(run_metrics.collect(result.get()) for result in pending)
+                run_metrics.add_phase('decode', decode_time)
+    return unit_id, prime_count, unit_numbers, unit_bytes, decode_time
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Pull work units from the server and count their primes.")
+    parser.add_argument("--host", default=SERVER_HOST, help="server address")
+    parser.add_argument("--port", type=int, default=SERVER_PORT, help="server port")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="worker processes (default: the auto-tuned count, else all CPU cores)")
+    parser.add_argument("--tune", metavar="DATA_FILE",
+                        help="auto-tune the pool on a sample dataset before connecting")
+    parser.add_argument("--retune", action="store_true", help="ignore a cached --tune result")
+    # Compression only pays off on slow links, so it is opt-in
+    parser.add_argument("--codecs", default=DEFAULT_CODEC,
+                        help=f"payload codecs to offer the server, most preferred first "
+                             f"(default: {DEFAULT_CODEC}; available: {','.join(CODECS)})")
+    parser.add_argument("--daemon", action="store_true",
+                        help="keep running: reconnect after each job or lost connection, keeping the pool warm")
+    metrics.add_arguments(parser)
+    return parser.parse_args()
+
+def connect(host: str, port: int) -> socket.socket:
+    """Open a client socket with optimized settings"""
     client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
     client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, BUFFER_SIZE)
-    
     try:
-        # Connect to server
-        print(f"Connecting to server at {SERVER_HOST}:{SERVER_PORT}")
-        client_socket.connect((SERVER_HOST, SERVER_PORT))
-        print("Connected to server")
+        client_socket.connect((host, port))
+    except OSError:
+        client_socket.close()
+        raise
+    return client_socket
+
+def current_load() -> float:
+    """One-minute load average (0 where the OS does not report it)"""
+    return os.getloadavg()[0] if hasattr(os, 'getloadavg') else 0.0
 
-        # Receive data with larger buffer
-        data = []
+def send_heartbeats(client_socket: socket.socket, send_lock: threading.Lock,
+                    num_processes: int, stop: threading.Event):
+    """Report cores, pool size and load every HEARTBEAT_INTERVAL seconds until stopped"""
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        try:
+            with send_lock:
+                send_message(client_socket, MSG_HEARTBEAT,
+                             pack_heartbeat(mp.cpu_count(), num_processes, current_load()))
+        except OSError:
+            return
+
+def run_session(client_socket: socket.socket, args, pool) -> int:
+    """
+    Process units over one connection until the server has no work left; returns units done.
+    Metrics, if requested, cover this session and are written when it ends.
+    """
+    run_metrics = metrics.from_args('client', args)
+    send_lock = threading.Lock()
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=send_heartbeats,
+                                 args=(client_socket, send_lock, args.processes, stop), daemon=True)
+    heartbeat.start()
+    try:
+        # Agree on how work payloads are encoded
+        with send_lock:
+            send_message(client_socket, MSG_HELLO, pack_hello(args.codecs.split(',')))
+        msg_type, payload = recv_message(client_socket)
+        if msg_type != MSG_HELLO:
+            raise ValueError(f"Expected a hello message, got type {msg_type}")
+        codec = unpack_hello(payload)[0]
+        print(f"Using codec {codec}")
+
+        units = 0
+        total_primes = 0
+        bytes_received = 0
+        decode_time = 0.0
         while True:
-            chunk = client_socket.recv(BUFFER_SIZE).decode()
-            if not chunk:
-                break
-            if '\n' in chunk:
-                data.append(chunk[:chunk.index('\n')])
+            # Ask for the next unit only when ready, so faster nodes take more of them
+            with send_lock:
+                send_message(client_socket, MSG_REQUEST_WORK)
+            start_time = time.perf_counter()
+            unit = count_streamed_unit(client_socket, codec, pool, args.processes * args.tasks_per_worker,
+                                       run_metrics)
+            if unit is None:
                 break
-            data.append(chunk)
-        
-        data_str = ''.join(data)
-        if not data_str:
-            raise ValueError("Received empty data from server")
-            
-        # Convert received data to numbers more efficiently
-        numbers = [int(x) for x in data_str.split(',')]
-        print(f"Received {len(numbers)} numbers to process")
-
-        # Process numbers using optimized parallel processing
-        start_time = time.time()
-        num_processes = mp.cpu_count()  # Use all available CPU cores
-        prime_count = parallel_prime_count(numbers, num_processes)
-        processing_time = time.time() - start_time
-
-        # Send results back to server
-        result = f"{prime_count},{processing_time}"
-        client_socket.sendall(result.encode())
-        
-        print(f"Found {prime_count} prime numbers in {processing_time:.2f} seconds")
-
-    except Exception as e:
-        print(f"Error: {e}")
+            unit_id, prime_count, unit_numbers, unit_bytes, unit_decode_time = unit
+            # Covers receiving, decoding and counting, which now overlap
+            processing_time = time.perf_counter() - start_time
+            bytes_received += unit_bytes
+            decode_time += unit_decode_time
+
+            with send_lock:
+                sent = send_message(client_socket, MSG_RESULT, pack_result(unit_id, prime_count, processing_time))
+            if run_metrics is not None:
+                run_metrics.add_bytes('sent', sent)
+            print(f"Unit {unit_id}: {prime_count} primes in {unit_numbers} numbers "
+                  f"({processing_time:.2f} seconds, {unit_bytes} bytes, "
+                  f"decoded in {unit_decode_time * 1000:.1f} ms)")
+            units += 1
+            total_primes += prime_count
+
+        print(f"No work left; processed {units} units with {total_primes} primes")
+        print(f"Received {bytes_received} payload bytes, {decode_time:.3f} seconds decoding")
+        metrics.export(run_metrics, args)
+        return units
     finally:
-        client_socket.close()
+        stop.set()
+
+def resolve_pool_config(args):
+    """Fill in --processes and the tasks per worker from --tune or the last tuning on this host"""
+    if args.tune:
+        config = tune_client(load_dataset(args.tune), args.retune)
+    else:
+        config = best_known("client") or {}
+    if args.processes is None:
+        args.processes = config.get("processes", mp.cpu_count())
+    # Streamed batches are small, so one task per process each unless tuning found otherwise
+    args.tasks_per_worker = config.get("tasks_per_worker", 1)
+    print(f"Using {args.processes} processes, {args.tasks_per_worker} tasks per process per batch")
+
+def main():
+    args = parse_args()
+    resolve_pool_config(args)
+
+    # The pool outlives connections, so in daemon mode workers stay warm between jobs
+    with mp.Pool(processes=args.processes) as pool:
+        backoff = RECONNECT_BACKOFF_MIN
+        while True:
+            client_socket = None
+            try:
+                print(f"Connecting to server at {args.host}:{args.port}")
+                client_socket = connect(args.host, args.port)
+                print("Connected to server")
+                backoff = RECONNECT_BACKOFF_MIN
+                run_session(client_socket, args, pool)
+                if not args.daemon:
+                    break
+            except Exception as e:
+                print(f"Error: {e}")
+                if not args.daemon:
+                    break
+            finally:
+                if client_socket is not None:
+                    client_socket.close()
+            # Wait for the next job (or for the server to come back), backing off exponentially
+            print(f"Reconnecting in {backoff:.0f} seconds")
+            time.sleep(backoff)
+            backoff = min(2 * backoff, RECONNECT_BACKOFF_MAX)
 
 if __name__ == "__main__":
     main()
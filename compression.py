@@ -0,0 +1,160 @@
+import argparse
+import lzma
+import sys
+import time
+import zlib
+from array import array
+
+from dataset import IndexRange, iter_dataset_chunks
+from primality import load_numpy
+from protocol import pack_numbers, unpack_numbers
+
+# Codecs in the order a client offers them by default. "varint" sorts the
+# numbers (their order does not matter for counting) and stores the gaps
+# as zigzag LEB128 varints; the suffixed codecs compress that stream again.
+CODECS = ('varint+zlib', 'varint', 'varint+lzma', 'raw')
+DEFAULT_CODEC = 'raw'
+ZLIB_LEVEL = 1
+LZMA_PRESET = 0
+
+def negotiate(offered, supported=CODECS):
+    """Return the first offered codec that is also supported (raw if none is)."""
+    for codec in offered:
+        if codec in supported:
+            return codec
+    return DEFAULT_CODEC
+
+def _as_array(numbers):
+    if isinstance(numbers, IndexRange):
+        numbers = numbers.values
+    if isinstance(numbers, (array, memoryview)):
+        return numbers
+    return array('q', numbers)
+
+def _zigzag_deltas(numbers):
+    """Sorted numbers as zigzag-encoded gaps (first gap is from zero)."""
+    np = load_numpy()
+    if np is not None:
+        values = np.sort(np.asarray(_as_array(numbers), dtype=np.int64))
+        deltas = np.diff(values, prepend=np.int64(0))
+        return ((deltas << 1) ^ (deltas >> 63)).view(np.uint64)
+    previous = 0
+    deltas = []
+    for n in sorted(numbers):
+        delta = n - previous
+        previous = n
+        deltas.append((delta << 1) ^ (delta >> 63))
+    return deltas
+
+def encode_varints(numbers):
+    """Sort numbers and encode their gaps as zigzag LEB128 varints."""
+    zigzag = _zigzag_deltas(numbers)
+    np = load_numpy()
+    if np is not None:
+        # Bytes per value, then every 7-bit group scattered to its offset
+        lengths = np.ones(len(zigzag), dtype=np.int64)
+        for k in range(1, 10):
+            lengths += zigzag >= np.uint64(1 << (7 * k))
+        offsets = np.cumsum(lengths) - lengths
+        out = np.empty(int(lengths.sum()), dtype=np.uint8)
+        for k in range(int(lengths.max(initial=0))):
+            rows = lengths > k
+            group = (zigzag[rows] >> np.uint64(7 * k)) & np.uint64(0x7F)
+            more = (lengths[rows] > k + 1).astype(np.uint64) << np.uint64(7)
+            out[offsets[rows] + k] = group | more
+        return out.tobytes()
+    out = bytearray()
+    for z in zigzag:
+        while z >= 0x80:
+            out.append(z & 0x7F | 0x80)
+            z >>= 7
+        out.append(z)
+    return bytes(out)
+
+def decode_varints(payload):
+    """Decode zigzag LEB128 gaps straight into sorted int64 values."""
+    np = load_numpy()
+    if np is not None:
+        data = np.frombuffer(payload, dtype=np.uint8)
+        if len(data) == 0:
+            return memoryview(array('q'))
+        ends = np.flatnonzero(data < 0x80)
+        starts = np.empty_like(ends)
+        starts[0] = 0
+        starts[1:] = ends[:-1] + 1
+        # Position of every byte inside its varint gives its shift
+        shift = np.arange(len(data), dtype=np.int64) - np.repeat(starts, ends - starts + 1)
+        groups = (data & 0x7F).astype(np.uint64) << (7 * shift).astype(np.uint64)
+        zigzag = np.bitwise_or.reduceat(groups, starts)
+        deltas = (zigzag >> np.uint64(1)).view(np.int64) ^ -(zigzag & np.uint64(1)).view(np.int64)
+        return memoryview(np.cumsum(deltas)).cast('B').cast('q')
+    values = array('q')
+    previous = 0
+    z = 0
+    shift = 0
+    for byte in payload:
+        z |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        previous += (z >> 1) ^ -(z & 1)
+        values.append(previous)
+        z = 0
+        shift = 0
+    return memoryview(values)
+
+def encode_numbers(numbers, codec):
+    """Encode numbers for the wire with codec; raw keeps their order."""
+    if codec == 'raw':
+        return pack_numbers(numbers)
+    encoded = encode_varints(numbers)
+    if codec == 'varint+zlib':
+        return zlib.compress(encoded, ZLIB_LEVEL)
+    if codec == 'varint+lzma':
+        return lzma.compress(encoded, preset=LZMA_PRESET)
+    if codec != 'varint':
+        raise ValueError(f"Unknown codec {codec}")
+    return encoded
+
+def decode_numbers(payload, codec):
+    """Decode a payload made by encode_numbers into int64 values."""
+    if codec == 'raw':
+        return unpack_numbers(payload)
+    if codec == 'varint+zlib':
+        payload = zlib.decompress(payload)
+    elif codec == 'varint+lzma':
+        payload = lzma.decompress(payload)
+    elif codec != 'varint':
+        raise ValueError(f"Unknown codec {codec}")
+    return decode_varints(payload)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure wire size and coding time of each codec.")
+    parser.add_argument("data_file", help="CSV or binary dataset")
+    parser.add_argument("--chunk-size", type=int, default=200_000, help="numbers per encoded chunk")
+    args = parser.parse_args()
+
+    chunks = list(iter_dataset_chunks(args.data_file, args.chunk_size))
+    count = sum(len(chunk) for chunk in chunks)
+    print(f"{count} numbers in {len(chunks)} chunks (NumPy {'on' if load_numpy() is not None else 'off'})")
+    print("Codec       | Bytes/number | Ratio | Encode ms/chunk | Decode ms/chunk")
+    print("-" * 70)
+    for codec in CODECS:
+        size = encode_time = decode_time = 0.0
+        for chunk in chunks:
+            start = time.perf_counter()
+            payload = encode_numbers(chunk, codec)
+            encode_time += time.perf_counter() - start
+            # What the receiver gets is plain bytes
+            payload = memoryview(payload).cast('B').tobytes()
+            size += len(payload)
+            start = time.perf_counter()
+            decoded = decode_numbers(payload, codec)
+            decode_time += time.perf_counter() - start
+            if sorted(decoded) != sorted(chunk):
+                sys.exit(f"{codec} did not round-trip")
+        print(f"{codec:<11} | {size / count:^12.2f} | {8 * count / size:^5.2f} | "
+              f"{1000 * encode_time / len(chunks):^15.1f} | {1000 * decode_time / len(chunks):^15.1f}")
+
+if __name__ == "__main__":
+    main()
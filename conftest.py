@@ -0,0 +1,15 @@
+import sys
+
+import pytest
+
+import primality
+
+@pytest.fixture(params=['numpy', 'pure-python'])
+def numpy_mode(request, monkeypatch):
+    """Run a test with NumPy and again as if it were not installed."""
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(primality, '_numpy', None)
+        monkeypatch.setitem(sys.modules, 'numpy', None)
+    return request.param
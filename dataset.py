@@ -0,0 +1,367 @@
+import argparse
+import copy
+import mmap
+import os
+import struct
+import sys
+from array import array
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import accumulate
+from multiprocessing import resource_tracker, shared_memory
+
+from metrics import measured_call, timed_phase
+
+# Bytes read from the CSV file per block
+DEFAULT_BLOCK_SIZE = 1 << 20
+# Numbers handed to a worker per chunk
+DEFAULT_CHUNK_SIZE = 100_000
+# Chunks submitted to the pool but not finished yet
+DEFAULT_MAX_IN_FLIGHT = 8
+# Smallest byte range worth parsing in another process
+MIN_PARSE_RANGE = 1 << 22
+# Bytes of a CSV file parsed at once when it is streamed in parallel
+DEFAULT_PARSE_WINDOW = 1 << 26
+
+# Binary dataset layout: magic, value count, then the values as
+# little-endian signed 64-bit integers
+BINARY_MAGIC = b'PRIMES01'
+BINARY_HEADER = struct.Struct('<8sQ')
+
+# Binary datasets already mapped by this process, keyed by path
+_mapped_datasets = {}
+
+def parse_numbers(text, out):
+    """Parse comma/newline separated integers from bytes into the array out."""
+    fields = text.replace(b'\n', b',').split(b',')
+    size = len(out)
+    try:
+        out.extend(map(int, fields))
+    except ValueError:
+        # Slow path: drop the partial extend, then skip headers, blank
+        # fields and other non-integer values
+        del out[size:]
+        for field in fields:
+            try:
+                out.append(int(field))
+            except ValueError:
+                pass
+
+def iter_number_chunks(file_path, chunk_size=DEFAULT_CHUNK_SIZE, block_size=DEFAULT_BLOCK_SIZE,
+                       start=0, end=None):
+    """
+    Yield the numbers of a CSV file as compact array('q') chunks.
+    The file is read in fixed-size blocks, so memory stays bounded by
+    block_size plus one chunk no matter how large the file is.
+    start and end limit reading to a byte range that begins and ends on field boundaries.
+    """
+    chunk = array('q')
+    leftover = b''
+    with open(file_path, 'rb') as file:
+        file.seek(start)
+        while True:
+            block = file.read(block_size if end is None else min(block_size, end - file.tell()))
+            if not block:
+                break
+            block = leftover + block
+            # Keep the trailing partial field for the next block
+            cut = max(block.rfind(b','), block.rfind(b'\n'))
+            if cut == -1:
+                leftover = block
+                continue
+            leftover = block[cut + 1:]
+            parse_numbers(block[:cut], chunk)
+            while len(chunk) >= chunk_size:
+                yield chunk[:chunk_size]
+                del chunk[:chunk_size]
+    parse_numbers(leftover, chunk)
+    for i in range(0, len(chunk), chunk_size):
+        yield chunk[i:i + chunk_size]
+
+def csv_byte_ranges(file_path, num_ranges, start=0, end=None):
+    """
+    Split a CSV file (or its start:end byte span, which must begin and end on
+    field boundaries) into up to num_ranges (start, end) byte ranges of
+    similar size. Each boundary is moved just past the next delimiter, so no
+    field is cut in two and every range can be parsed on its own.
+    """
+    if end is None:
+        end = os.path.getsize(file_path)
+    if end <= start:
+        return []
+    span = end - start
+    boundaries = [start]
+    with open(file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for i in range(1, num_ranges):
+            target = max(start + i * span // num_ranges, boundaries[-1])
+            cuts = [cut for cut in (data.find(b',', target, end), data.find(b'\n', target, end)) if cut != -1]
+            boundary = min(cuts) + 1 if cuts else end
+            if boundary >= end:
+                break
+            boundaries.append(boundary)
+    boundaries.append(end)
+    return [(low, high) for low, high in zip(boundaries, boundaries[1:]) if high > low]
+
+def attach_shared_memory(name):
+    """
+    Open an existing shared memory block without tracking it here. Before
+    Python 3.13 attaching also registers the block with this process's
+    resource tracker, so a pool worker forked before the parent's tracker
+    started would unlink (and warn about) every block it touched on exit,
+    although only the creator owns them.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    block = shared_memory.SharedMemory(name=name)
+    resource_tracker.unregister(block._name, 'shared_memory')
+    return block
+
+def _read_byte_range(file_path, start, end):
+    with open(file_path, 'rb') as file:
+        file.seek(start)
+        return file.read(end - start)
+
+def parse_byte_range(task):
+    """Parse the integers of a (file path, start, end) byte range into an array('q')."""
+    numbers = array('q')
+    parse_numbers(_read_byte_range(*task), numbers)
+    return numbers
+
+def count_fields(task):
+    """Count the fields of a (file path, start, end) byte range: an upper bound on its integers."""
+    text = _read_byte_range(*task)
+    return text.count(b',') + text.count(b'\n') + 1
+
+def parse_byte_range_into(task):
+    """
+    Parse a (file path, start, end, block name, offset) byte range straight
+    into a shared int64 block from offset on; return how many integers it held.
+    """
+    file_path, start, end, block_name, offset = task
+    numbers = parse_byte_range((file_path, start, end))
+    block = attach_shared_memory(block_name)
+    try:
+        with block.buf.cast('q') as view:
+            view[offset:offset + len(numbers)] = numbers
+    finally:
+        block.close()
+    return len(numbers)
+
+def parse_csv_parallel(file_path, workers=None, executor=None, start=0, end=None):
+    """
+    Parse a CSV file (or its start:end byte span) into one array('q') using
+    byte ranges parsed by several processes (executor's, or a pool of workers
+    made for the call). A first pass counts each range's fields, so every
+    worker writes its integers into its own slot of one shared memory block
+    instead of sending them back pickled; the slots are then joined in file
+    order. Small files are parsed here.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if end is None:
+        end = os.path.getsize(file_path)
+    num_ranges = max(1, min(workers, (end - start) // MIN_PARSE_RANGE))
+    tasks = [(file_path, low, high) for low, high in csv_byte_ranges(file_path, num_ranges, start, end)]
+    if len(tasks) <= 1:
+        numbers = array('q')
+        for task in tasks:
+            numbers.extend(parse_byte_range(task))
+        return numbers
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=len(tasks)) as executor:
+            return parse_csv_parallel(file_path, workers, executor, start, end)
+
+    offsets = list(accumulate(executor.map(count_fields, tasks), initial=0))
+    numbers = array('q')
+    block = shared_memory.SharedMemory(create=True, size=offsets[-1] * numbers.itemsize)
+    try:
+        counts = executor.map(parse_byte_range_into,
+                              [(*task, block.name, offset) for task, offset in zip(tasks, offsets)])
+        for offset, count in zip(offsets, counts):
+            with block.buf[offset * numbers.itemsize:(offset + count) * numbers.itemsize] as part:
+                numbers.frombytes(part)
+        return numbers
+    finally:
+        block.close()
+        block.unlink()
+
+def iter_csv_chunks_parallel(file_path, chunk_size=DEFAULT_CHUNK_SIZE, workers=None,
+                             window_size=DEFAULT_PARSE_WINDOW):
+    """
+    Yield the numbers of a CSV file as array('q') chunks, parsing it one
+    window_size span at a time with parse_csv_parallel on one pool, so
+    parsing scales with cores while memory stays bounded by about a window.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    num_windows = max(1, -(-os.path.getsize(file_path) // window_size))
+    leftover = array('q')
+    # Workers only start once a window is large enough to be split
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for start, end in csv_byte_ranges(file_path, num_windows):
+            numbers = leftover + parse_csv_parallel(file_path, workers, executor, start, end)
+            usable = len(numbers) - len(numbers) % chunk_size
+            for i in range(0, usable, chunk_size):
+                yield numbers[i:i + chunk_size]
+            leftover = numbers[usable:]
+    if leftover:
+        yield leftover
+
+def convert_csv_to_binary(csv_path, binary_path):
+    """Convert a CSV file to the binary dataset format and return the value count."""
+    count = 0
+    tmp_path = binary_path + '.tmp'
+    with open(tmp_path, 'wb') as out:
+        out.write(BINARY_HEADER.pack(BINARY_MAGIC, 0))
+        for chunk in iter_number_chunks(csv_path):
+            if sys.byteorder != 'little':
+                chunk.byteswap()
+            chunk.tofile(out)
+            count += len(chunk)
+        # Patch the real count into the header once it is known
+        out.seek(0)
+        out.write(BINARY_HEADER.pack(BINARY_MAGIC, count))
+    os.replace(tmp_path, binary_path)
+    return count
+
+def is_binary_dataset(path):
+    """Check whether path is a binary dataset (False if it is missing or a CSV)."""
+    try:
+        with open(path, 'rb') as file:
+            return file.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+    except OSError:
+        return False
+
+def _map_binary(path):
+    """Memory-map a binary dataset once per process and return its values."""
+    values = _mapped_datasets.get(path)
+    if values is None:
+        with open(path, 'rb') as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = BINARY_HEADER.unpack_from(mapped)
+        if magic != BINARY_MAGIC:
+            raise ValueError(f"{path} is not a binary dataset")
+        raw = memoryview(mapped)[BINARY_HEADER.size:BINARY_HEADER.size + 8 * count]
+        if sys.byteorder == 'little':
+            values = raw.cast('q')
+        else:
+            # Big-endian hosts need one byte-swapped copy
+            swapped = array('q', raw)
+            swapped.byteswap()
+            values = memoryview(swapped)
+        _mapped_datasets[path] = values
+    return values
+
+class IndexRange:
+    """
+    Base class for a contiguous range of int64 values held in a buffer that
+    every process can reach by name. Slicing returns another range without
+    copying, and pickling only sends the name and the bounds, so pool workers
+    attach to the same buffer and read their own range directly.
+    Subclasses implement _buffer() returning the full memoryview.
+    """
+
+    def __init__(self, start, stop):
+        self.start = start
+        self.stop = stop
+
+    def _buffer(self):
+        raise NotImplementedError
+
+    @property
+    def values(self):
+        """Memoryview of the int64 values in this range."""
+        return self._buffer()[self.start:self.stop]
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                raise ValueError(f"{type(self).__name__} only supports contiguous slices")
+            sliced = copy.copy(self)
+            sliced.start = self.start + start
+            sliced.stop = self.start + max(start, stop)
+            return sliced
+        return self.values[key]
+
+    def __array__(self, dtype=None, copy=None):
+        import numpy as np
+        return np.frombuffer(self.values, dtype=np.int64)
+
+class BinaryDataset(IndexRange):
+    """An index range of a memory-mapped binary dataset."""
+
+    def __init__(self, path, start=0, stop=None):
+        self.path = path
+        super().__init__(start, len(_map_binary(path)) if stop is None else stop)
+
+    def _buffer(self):
+        return _map_binary(self.path)
+
+def load_dataset(path, workers=None, executor=None):
+    """
+    Load a whole dataset: a BinaryDataset for binary files, else a compact
+    array('q') parsed in parallel byte ranges (see parse_csv_parallel).
+    """
+    if is_binary_dataset(path):
+        return BinaryDataset(path)
+    return parse_csv_parallel(path, workers, executor)
+
+def iter_dataset_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield chunks of a CSV or binary dataset; binary chunks are index ranges."""
+    if is_binary_dataset(path):
+        dataset = BinaryDataset(path)
+        for start in range(0, len(dataset), chunk_size):
+            yield dataset[start:start + chunk_size]
+    else:
+        yield from iter_number_chunks(path, chunk_size)
+
+def count_primes_streaming(executor, chunks, count_fn, max_in_flight=DEFAULT_MAX_IN_FLIGHT, metrics=None):
+    """
+    Submit chunks to executor as they are read and sum count_fn's results.
+    At most max_in_flight chunks are pending at once, so reading overlaps
+    with computing without buffering the whole file.
+    With metrics, reading, dispatching and waiting are timed as phases and
+    each chunk's worker and busy time is recorded.
+    """
+    if metrics is None:
+        result = lambda future: future.result()
+        submit = lambda chunk: executor.submit(count_fn, chunk)
+    else:
+        result = lambda future: metrics.collect(future.result())
+        submit = lambda chunk: executor.submit(measured_call, count_fn, chunk, metrics.profiling)
+    chunks = iter(chunks)
+    total = 0
+    pending = set()
+    while True:
+        with timed_phase(metrics, 'read'):
+            chunk = next(chunks, None)
+        if chunk is None:
+            break
+        if len(pending) >= max_in_flight:
+            with timed_phase(metrics, 'gather'):
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                total += sum(result(future) for future in done)
+        with timed_phase(metrics, 'dispatch'):
+            pending.add(submit(chunk))
+    with timed_phase(metrics, 'gather'):
+        for future in pending:
+            total += result(future)
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a CSV file of numbers to the binary dataset format.")
+    parser.add_argument("csv_path", help="CSV file to read")
+    parser.add_argument("binary_path", help="binary dataset to write")
+    args = parser.parse_args()
+
+    count = convert_csv_to_binary(args.csv_path, args.binary_path)
+    print(f"Wrote {count} numbers to {args.binary_path}")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,12 @@
+import argparse
 import csv
 import time
 import math
+from primality import count_primes_sieve, sieve_is_cheaper
+from dataset import BinaryDataset, is_binary_dataset
+from checkpoint import count_primes_incremental
+import metrics
+from metrics import timed_phase
 
 # Función para verificar si un número es primo
 def es_primo(n):
@@ -15,32 +21,90 @@ def es_primo(n):
             return False
     return True
 
-# Función para leer el archivo CSV y contar los números primos
-def contar_primos_en_csv(archivo_csv):
-    primos_encontrados = 0
-    # Leer el archivo CSV
+# Función para leer los números de un archivo CSV
+def leer_numeros_csv(archivo_csv):
+    numeros = []
     with open(archivo_csv, mode='r') as archivo:
         lector = csv.reader(archivo)
         for fila in lector:
             for valor in fila:
                 try:
-                    numero = int(valor)
-                    if es_primo(numero):
-                        primos_encontrados += 1
+                    numeros.append(int(valor))
                 except ValueError:
                     # Si no se puede convertir a número, lo ignoramos
                     continue
+    return numeros
+
+# Función para contar los números primos de una secuencia ya cargada
+def contar_primos(numeros):
+    # Si el rango de valores lo permite, la criba por segmentos es más barata
+    if numeros and sieve_is_cheaper(len(numeros), max(numeros)):
+        return count_primes_sieve(numeros)
+
+    primos_encontrados = 0
+    for numero in numeros:
+        if es_primo(numero):
+            primos_encontrados += 1
     return primos_encontrados
 
+# Función para leer el archivo CSV (o binario) y contar los números primos
+# (si se pasa metrics, se mide la lectura y el conteo por separado)
+def contar_primos_en_csv(archivo_csv, metrics=None):
+    with timed_phase(metrics, 'load'):
+        if is_binary_dataset(archivo_csv):
+            # Los ficheros binarios se mapean en memoria sin parsear texto
+            numeros = BinaryDataset(archivo_csv)
+        else:
+            numeros = leer_numeros_csv(archivo_csv)
+    if metrics is None:
+        return contar_primos(numeros)
+    with metrics.phase('compute'):
+        return metrics.call(contar_primos, numeros)
+
+# Función para contar los primos de una secuencia de trozos
+# (si se pasa metrics, se mide la lectura y el conteo de cada trozo)
+def contar_primos_en_trozos(trozos, metrics=None):
+    if metrics is None:
+        return sum(contar_primos(trozo) for trozo in trozos)
+    trozos = iter(trozos)
+    primos_encontrados = 0
+    while True:
+        with metrics.phase('load'):
+            trozo = next(trozos, None)
+        if trozo is None:
+            return primos_encontrados
+        with metrics.phase('compute'):
+            primos_encontrados += metrics.call(contar_primos, trozo)
+
+# Función para contar solo lo añadido al CSV desde la última ejecución
+# (el punto de control guarda el desplazamiento y el conteo acumulado)
+def contar_primos_incremental(archivo_csv, metrics=None):
+    resultado = count_primes_incremental(archivo_csv, lambda trozos: contar_primos_en_trozos(trozos, metrics))
+    if metrics is not None:
+        metrics.add_bytes('read', resultado.new_bytes)
+    return resultado.primes
+
 # Función principal
 def main():
-    archivo_csv = 'numeros_aleatorios.csv'  # Asegúrate de que el archivo esté en el mismo directorio
+    # Se puede pasar la ruta de un CSV o de un fichero binario como argumento
+    parser = argparse.ArgumentParser(description="Cuenta los números primos de un CSV con un solo proceso.")
+    parser.add_argument("archivo_csv", nargs="?", default='numeros_aleatorios.csv',  # Asegúrate de que el archivo esté en el mismo directorio
+                        help="CSV o fichero binario a procesar")
+    parser.add_argument("--incremental", action="store_true",
+                        help="procesar solo lo añadido al CSV desde la última ejecución")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    archivo_csv = args.archivo_csv
+    metricas = metrics.from_args('escenarioBase_1proceso', args)
 
     # Iniciar el conteo del tiempo
     inicio = time.time()
 
     # Contar los números primos en el archivo CSV
-    primos = contar_primos_en_csv(archivo_csv)
+    if args.incremental:
+        primos = contar_primos_incremental(archivo_csv, metricas)
+    else:
+        primos = contar_primos_en_csv(archivo_csv, metricas)
 
     # Finalizar el conteo del tiempo
     fin = time.time()
@@ -49,6 +113,7 @@ def main():
     tiempo_total = fin - inicio
     print(f"Cantidad de números primos encontrados: {primos}")
     print(f"Tiempo total de ejecución: {tiempo_total:.4f} segundos")
+    metrics.export(metricas, args)
 
 # Ejecutar el programa
 if __name__ == "__main__":
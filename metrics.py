@@ -0,0 +1,220 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:  # Windows: peak RSS is not reported
+    resource = None
+
+# Prefix of every exported Prometheus metric
+PROMETHEUS_PREFIX = 'primes'
+
+def worker_name():
+    """Identify the current worker as process id / thread name."""
+    return f"{os.getpid()}/{threading.current_thread().name}"
+
+def task_size(task):
+    """Numbers in a task: a sequence, a (values, multiplicities) pair or a (start, end, numbers) range."""
+    if isinstance(task, tuple):
+        if len(task) == 3 and isinstance(task[0], int):
+            return task[1] - task[0]
+        task = task[0]
+    try:
+        return len(task)
+    except TypeError:
+        return 1
+
+def measured_call(fn, task, profile=False):
+    """
+    Run fn(task) in a worker and return (result, worker, items, busy seconds,
+    profile file). With profile, the call runs under cProfile and its stats
+    are dumped to a temporary file for the parent to merge.
+    """
+    start = time.perf_counter()
+    profile_path = None
+    if profile:
+        # Profiling modules are only loaded by runs that ask for --profile
+        import cProfile
+        profiler = cProfile.Profile()
+        result = profiler.runcall(fn, task)
+        fd, profile_path = tempfile.mkstemp(suffix='.prof')
+        os.close(fd)
+        profiler.dump_stats(profile_path)
+    else:
+        result = fn(task)
+    return result, worker_name(), task_size(task), time.perf_counter() - start, profile_path
+
+def peak_rss():
+    """Peak resident set size in bytes of this process and of its finished children."""
+    if resource is None:
+        return {}
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale,
+    }
+
+class Metrics:
+    """
+    Measurements of one run of an entry point: wall time per phase, items,
+    tasks and busy time per worker, bytes transferred and peak RSS.
+    A worker's idle time is the run's wall time minus its busy time.
+    Phases and workers may be recorded from several threads.
+    """
+
+    def __init__(self, entry_point, profile_path=None):
+        self.entry_point = entry_point
+        self.profile_path = profile_path
+        self.phases = {}
+        self.bytes = {}
+        self.workers = {}
+        self._profiles = []
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self.wall_time = None
+
+    @property
+    def profiling(self):
+        return self.profile_path is not None
+
+    @contextmanager
+    def phase(self, name):
+        """Add the wall time spent in the block to phase name."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - start)
+
+    def add_phase(self, name, seconds):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def add_bytes(self, direction, count):
+        with self._lock:
+            self.bytes[direction] = self.bytes.get(direction, 0) + count
+
+    def record_task(self, worker, items, busy, tasks=1):
+        with self._lock:
+            stats = self.workers.setdefault(worker, {"tasks": 0, "items": 0, "busy": 0.0})
+            stats["tasks"] += tasks
+            stats["items"] += items
+            stats["busy"] += busy
+
+    def collect(self, measured):
+        """Record the output of measured_call and return the task's own result."""
+        result, worker, items, busy, profile_path = measured
+        self.record_task(worker, items, busy)
+        if profile_path is not None:
+            with self._lock:
+                self._profiles.append(profile_path)
+        return result
+
+    def call(self, fn, task):
+        """Run one task in this process, measured like a pool task."""
+        return self.collect(measured_call(fn, task, self.profiling))
+
+    def finish(self):
+        """Stop the run clock (done automatically on export)."""
+        if self.wall_time is None:
+            self.wall_time = time.perf_counter() - self._started
+
+    def to_dict(self):
+        self.finish()
+        return {
+            "entry_point": self.entry_point,
+            "wall_time": self.wall_time,
+            "phases": dict(self.phases),
+            "workers": {worker: {**stats, "idle": max(0.0, self.wall_time - stats["busy"])}
+                        for worker, stats in self.workers.items()},
+            "bytes": dict(self.bytes),
+            "peak_rss": peak_rss(),
+        }
+
+    def write_json(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+    def write_prometheus(self, path):
+        """Write the metrics in the Prometheus text exposition format."""
+        data = self.to_dict()
+        entry = data["entry_point"]
+        lines = []
+
+        def gauge(name, help_text, samples):
+            metric = f"{PROMETHEUS_PREFIX}_{name}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} gauge")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{val}"' for key, val in [("entry_point", entry), *labels])
+                lines.append(f"{metric}{{{label_text}}} {value}")
+
+        gauge("wall_seconds", "Wall-clock time of the run.", [((), data["wall_time"])])
+        gauge("phase_seconds", "Wall-clock time per phase.",
+              [((("phase", name),), seconds) for name, seconds in data["phases"].items()])
+        workers = data["workers"].items()
+        gauge("worker_tasks", "Tasks run per worker.", [((("worker", w),), s["tasks"]) for w, s in workers])
+        gauge("worker_items", "Numbers checked per worker.", [((("worker", w),), s["items"]) for w, s in workers])
+        gauge("worker_busy_seconds", "Time each worker spent running tasks.",
+              [((("worker", w),), s["busy"]) for w, s in workers])
+        gauge("worker_idle_seconds", "Wall time each worker was not running tasks.",
+              [((("worker", w),), s["idle"]) for w, s in workers])
+        gauge("bytes", "Bytes transferred.", [((("direction", d),), n) for d, n in data["bytes"].items()])
+        gauge("peak_rss_bytes", "Peak resident set size.",
+              [((("scope", scope),), n) for scope, n in data["peak_rss"].items()])
+        with open(path, 'w') as file:
+            file.write("\n".join(lines) + "\n")
+
+    def write_profile(self):
+        """Merge the profiles of every measured task into profile_path; False if there were none."""
+        with self._lock:
+            paths, self._profiles = self._profiles, []
+        if not paths:
+            return False
+        import pstats
+        stats = pstats.Stats(paths[0])
+        for path in paths[1:]:
+            stats.add(path)
+        stats.dump_stats(self.profile_path)
+        for path in paths:
+            os.remove(path)
+        return True
+
+def timed_phase(metrics, name):
+    """metrics.phase(name), or a no-op context when metrics is None."""
+    return nullcontext() if metrics is None else metrics.phase(name)
+
+def add_arguments(parser):
+    """Add the --metrics-json, --metrics-prom and --profile options to an argparse parser."""
+    parser.add_argument("--metrics-json", metavar="PATH", help="write phase, worker and memory metrics as JSON")
+    parser.add_argument("--metrics-prom", metavar="PATH", help="write the metrics as a Prometheus text file")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="profile every counting task with cProfile and save the merged stats")
+
+def from_args(entry_point, args):
+    """Return a Metrics for entry_point if any metrics option was given, else None."""
+    if args.metrics_json or args.metrics_prom or args.profile:
+        return Metrics(entry_point, args.profile)
+    return None
+
+def export(metrics, args):
+    """Write the outputs requested on the command line."""
+    if metrics is None:
+        return
+    if args.metrics_json:
+        metrics.write_json(args.metrics_json)
+        print(f"Metrics saved to {args.metrics_json}")
+    if args.metrics_prom:
+        metrics.write_prometheus(args.metrics_prom)
+        print(f"Prometheus metrics saved to {args.metrics_prom}")
+    if args.profile:
+        if metrics.write_profile():
+            print(f"Profile saved to {args.profile} (view with: python -m pstats {args.profile})")
+        else:
+            print("No counting tasks ran in this process; no profile written")
@@ -0,0 +1,295 @@
+import os
+import threading
+import time
+from array import array
+from collections import Counter, deque
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from functools import partial
+from multiprocessing import shared_memory
+
+from dataset import IndexRange, attach_shared_memory
+from metrics import measured_call, timed_phase
+from primality import trial_division_cost
+
+# Shared memory blocks attached by this process, keyed by block name
+# (in attach order, so the oldest are detached first)
+_attached_blocks = {}
+# Blocks a worker keeps attached; long-lived pools would otherwise map every
+# block they were ever sent
+MAX_ATTACHED_BLOCKS = 16
+
+# Seconds each warm-up task holds its worker, so every worker gets one
+WARM_UP_DELAY = 0.05
+
+# Tasks the cost-aware scheduler makes per worker
+TASKS_PER_WORKER = 8
+# Values sampled per task when estimating costs
+COST_SAMPLES_PER_TASK = 64
+
+def _attach(name):
+    """Attach to a shared memory block once per process and return its int64 view."""
+    entry = _attached_blocks.get(name)
+    if entry is None:
+        while len(_attached_blocks) >= MAX_ATTACHED_BLOCKS:
+            _detach(next(iter(_attached_blocks)))
+        block = attach_shared_memory(name)
+        entry = (block, block.buf.cast('q'))
+        _attached_blocks[name] = entry
+    return entry[1]
+
+def _detach(name):
+    """Drop this process's attachment to a block (the owner still unlinks it)."""
+    block, view = _attached_blocks.pop(name)
+    try:
+        view.release()
+        block.close()
+    except BufferError:
+        # A slice of the buffer is still referenced; it is freed with it
+        pass
+
+class SharedNumbers(IndexRange):
+    """An index range of numbers placed in a multiprocessing shared memory block."""
+
+    def __init__(self, name, start, stop):
+        self.name = name
+        super().__init__(start, stop)
+
+    def _buffer(self):
+        return _attach(self.name)
+
+def detach_stale_blocks(numbers, keep):
+    """
+    Detach this process's oldest blocks other than the one behind numbers,
+    so that at most keep blocks stay attached once numbers' block is.
+    For callers whose blocks are short-lived and never reused once replaced.
+    """
+    current = numbers.name if isinstance(numbers, SharedNumbers) else None
+    others = [name for name in _attached_blocks if name != current]
+    for name in others[:max(0, len(others) - keep + 1)]:
+        _detach(name)
+
+@contextmanager
+def share_numbers(numbers, metrics=None):
+    """
+    Copy numbers into one shared memory block and yield it as SharedNumbers.
+    Workers receive only (name, start, stop) descriptors instead of pickled
+    chunks. Index ranges that are already shareable are yielded unchanged.
+    The copy is timed as the 'share' phase of metrics if given.
+    """
+    if isinstance(numbers, IndexRange):
+        yield numbers
+        return
+
+    started = time.perf_counter()
+    if isinstance(numbers, array) and numbers.typecode == 'q':
+        values = numbers
+    elif isinstance(numbers, memoryview) and numbers.format == 'q':
+        values = numbers
+    else:
+        values = array('q', numbers)
+    # Zero-size blocks are not allowed, so always reserve one slot
+    block = shared_memory.SharedMemory(create=True, size=max(len(values), 1) * values.itemsize)
+    view = block.buf.cast('q')
+    try:
+        view[:len(values)] = values
+        if metrics is not None:
+            metrics.add_phase('share', time.perf_counter() - started)
+        _attached_blocks[block.name] = (block, view)
+        yield SharedNumbers(block.name, 0, len(values))
+    finally:
+        _attached_blocks.pop(block.name, None)
+        view.release()
+        try:
+            block.close()
+        except BufferError:
+            # A slice of the buffer is still referenced; it is freed with it
+            pass
+        block.unlink()
+
+def _warm_up(delay):
+    """Trivial task that keeps a worker busy so the pool has to start them all."""
+    time.sleep(delay)
+    return os.getpid()
+
+class BoundedExecutor:
+    """
+    Runs tasks on a shared executor with at most limit of them running at
+    once. submit() never blocks: tasks over the limit wait in a queue and
+    are handed to the executor as running ones finish, so callers timing
+    their dispatch only see the submission. Lets a large warm pool stand
+    in for a smaller one.
+    """
+
+    def __init__(self, executor, limit):
+        self._executor = executor
+        self._limit = limit
+        self._lock = threading.Lock()
+        self._queued = deque()
+        self._running = 0
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        with self._lock:
+            if self._running >= self._limit:
+                self._queued.append((future, fn, args, kwargs))
+                return future
+            self._running += 1
+        self._start(future, fn, args, kwargs)
+        return future
+
+    def _start(self, future, fn, args, kwargs):
+        if not future.set_running_or_notify_cancel():
+            self._task_done()
+            return
+        try:
+            running = self._executor.submit(fn, *args, **kwargs)
+        except BaseException as exc:
+            self._task_done()
+            future.set_exception(exc)
+            return
+        running.add_done_callback(partial(self._finish, future))
+
+    def _finish(self, future, running):
+        # Start the next queued task before waking the caller, so the slot never idles
+        self._task_done()
+        if running.cancelled():
+            future.set_exception(CancelledError())
+        elif running.exception() is not None:
+            future.set_exception(running.exception())
+        else:
+            future.set_result(running.result())
+
+    def _task_done(self):
+        with self._lock:
+            if not self._queued:
+                self._running -= 1
+                return
+            task = self._queued.popleft()
+        self._start(*task)
+
+class WorkerPool:
+    """
+    A process pool kept alive across benchmark runs.
+    resize() only spawns workers when a run needs more processes than are
+    already running; smaller runs reuse the same warm workers with at most
+    size tasks in flight. Resize to the largest size first to start every
+    worker once. Startup and warm-up time is reported separately so that
+    measured run times only contain steady-state compute.
+    """
+
+    def __init__(self):
+        self._pool = None
+        self.executor = None
+        self.capacity = 0
+        self.size = 0
+        self.startup_time = 0.0
+
+    def resize(self, size):
+        """Run at most size tasks at once, starting more warm workers if needed; return the startup seconds spent."""
+        elapsed = 0.0
+        if size > self.capacity:
+            start = time.perf_counter()
+            self.shutdown()
+            self._pool = ProcessPoolExecutor(max_workers=size)
+            # One blocking task per worker forces every process to spawn and import now
+            list(self._pool.map(_warm_up, [WARM_UP_DELAY] * size))
+            self.capacity = size
+            elapsed = time.perf_counter() - start - WARM_UP_DELAY
+            self.startup_time += elapsed
+        if size != self.size:
+            self.executor = BoundedExecutor(self._pool, size)
+            self.size = size
+        return elapsed
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+            self.executor = None
+            self.capacity = 0
+            self.size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+def balanced_ranges(numbers, num_tasks):
+    """
+    Cut numbers into up to num_tasks contiguous (start, stop) ranges of
+    roughly equal estimated cost. Trial division cost grows with sqrt(n)
+    (and is capped where Miller-Rabin takes over), so ranges of large values
+    get fewer items. Costs are estimated on an evenly strided sample.
+    """
+    length = len(numbers)
+    if length == 0:
+        return []
+    num_tasks = max(1, min(num_tasks, length))
+    stride = max(1, length // (num_tasks * COST_SAMPLES_PER_TASK))
+
+    positions = range(0, length, stride)
+    costs = [trial_division_cost(1, max(numbers[i], 0)) for i in positions]
+    target = sum(costs) / num_tasks
+
+    ranges = []
+    start = 0
+    acc = 0.0
+    for i, cost in zip(positions, costs):
+        acc += cost
+        if acc >= target and len(ranges) < num_tasks - 1:
+            stop = min(i + stride, length)
+            ranges.append((start, stop))
+            start = stop
+            acc = 0.0
+    if start < length:
+        ranges.append((start, length))
+    return ranges
+
+def make_balanced_tasks(numbers, num_tasks):
+    """Slice numbers into cost-balanced tasks (index ranges stay zero-copy)."""
+    return [numbers[start:stop] for start, stop in balanced_ranges(numbers, num_tasks)]
+
+def sum_as_completed(executor, fn, tasks, metrics=None):
+    """
+    Submit every task and sum the results as they finish. The pool hands
+    tasks to whichever worker is free, so fast workers simply take more.
+    With metrics, submitting (which pickles the tasks for process pools) and
+    gathering are timed as phases and each task's worker and busy time is recorded.
+    """
+    if metrics is None:
+        futures = [executor.submit(fn, task) for task in tasks]
+        return sum(future.result() for future in as_completed(futures))
+    with metrics.phase('dispatch'):
+        futures = [executor.submit(measured_call, fn, task, metrics.profiling) for task in tasks]
+    with metrics.phase('gather'):
+        return sum(metrics.collect(future.result()) for future in as_completed(futures))
+
+def unique_with_counts(numbers):
+    """
+    Collapse numbers to sorted distinct values and their multiplicities,
+    both as array('q'). Uses np.unique when NumPy is available.
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        counts = Counter(numbers)
+        values = array('q', sorted(counts))
+        return values, array('q', (counts[n] for n in values))
+    values, counts = np.unique(np.asarray(numbers, dtype=np.int64), return_counts=True)
+    return array('q', values.tobytes()), array('q', counts.astype(np.int64).tobytes())
+
+def count_deduplicated(executor, count_fn, numbers, num_tasks, metrics=None):
+    """
+    Test every distinct value once. count_fn receives (values, multiplicities)
+    tasks and returns the multiplicity-weighted prime count, so the work
+    scales with the number of distinct values instead of total rows.
+    """
+    with timed_phase(metrics, 'dedupe'):
+        values, multiplicities = unique_with_counts(numbers)
+    with share_numbers(values) as shared_values, share_numbers(multiplicities) as shared_counts:
+        with timed_phase(metrics, 'split'):
+            tasks = [(shared_values[start:stop], shared_counts[start:stop])
+                     for start, stop in balanced_ranges(shared_values, num_tasks)]
+        return sum_as_completed(executor, count_fn, tasks, metrics)
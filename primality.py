@@ -0,0 +1,189 @@
+import sys
+import threading
+from math import isqrt, log
+
+# Size of each sieve segment (bytes of working memory per segment)
+SIEVE_SEGMENT_SIZE = 1 << 20
+# Largest value the batch sieve will be used for
+SIEVE_MAX_VALUE = 1 << 40
+# Rough number of bytearray operations done in C per Python-level iteration
+SIEVE_C_SPEEDUP = 30
+
+# Above this value is_prime switches from trial division to Miller-Rabin
+MILLER_RABIN_THRESHOLD = 1 << 20
+# Small primes used both as a cheap prefilter and as Miller-Rabin witnesses.
+# Testing against the first 12 primes is deterministic for n < 3.18 * 10**23,
+# which covers every 64-bit integer.
+SMALL_PRIMES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37)
+PREFILTER_PRIMES = SMALL_PRIMES + (41, 43, 47, 53, 59, 61, 67, 71, 73, 79, 83, 89, 97)
+
+# Values below this are answered from a shared NumPy prime table (one byte per value)
+NUMPY_TABLE_MAX_VALUE = 1 << 26
+
+# Prime table shared by every thread of the process, grown in powers of two
+_numpy_table = None
+_numpy_table_lock = threading.Lock()
+
+# NumPy module once load_numpy has run (None if it is not installed)
+_numpy = False
+
+def sieve_primes_up_to(limit):
+    """Return the list of primes <= limit using a plain sieve of Eratosthenes."""
+    if limit < 2:
+        return []
+    sieve = bytearray([1]) * (limit + 1)
+    sieve[0] = sieve[1] = 0
+    for p in range(2, isqrt(limit) + 1):
+        if sieve[p]:
+            sieve[p * p::p] = bytes(len(range(p * p, limit + 1, p)))
+    return [p for p in range(2, limit + 1) if sieve[p]]
+
+def trial_division_cost(count, max_value):
+    """Estimate the Python-level iterations trial division needs for count values."""
+    if max_value < 5:
+        return count
+    # Above the threshold is_prime uses Miller-Rabin, whose cost is roughly
+    # that of trial division at the threshold itself
+    bound = min(max_value, MILLER_RABIN_THRESHOLD)
+    # Only primes run the full 6k±1 loop, and about 1 in ln(n) values is prime
+    return count * (isqrt(bound) / (3 * log(bound)) + 1)
+
+def sieve_cost(count, max_value):
+    """Estimate the cost of answering count lookups with a segmented sieve."""
+    base_primes = isqrt(max_value) / max(log(max_value), 1)
+    segments = max_value // SIEVE_SEGMENT_SIZE + 1
+    return max_value / SIEVE_C_SPEEDUP + segments * base_primes + count
+
+def sieve_is_cheaper(count, max_value):
+    """Decide whether the batch sieve beats per-number trial division."""
+    if count == 0 or max_value < 2 or max_value > SIEVE_MAX_VALUE:
+        return False
+    return sieve_cost(count, max_value) < trial_division_cost(count, max_value)
+
+def count_primes_sieve(numbers, weights=None):
+    """
+    Count the primes in numbers with a segmented sieve.
+    Values are sorted and the sieve is only built for segments that contain
+    values, so memory stays at one segment plus the base primes up to sqrt(max).
+    If weights is given, each prime counts as its weight instead of 1.
+    """
+    if weights is None:
+        values = sorted(n for n in numbers if n > 1)
+    else:
+        pairs = sorted((n, w) for n, w in zip(numbers, weights) if n > 1)
+        values = [n for n, _ in pairs]
+        weights = [w for _, w in pairs]
+    if not values:
+        return 0
+
+    base_primes = sieve_primes_up_to(isqrt(values[-1]))
+    count = 0
+    i = 0
+    while i < len(values):
+        low = values[i] - values[i] % SIEVE_SEGMENT_SIZE
+        high = low + SIEVE_SEGMENT_SIZE
+        segment = bytearray([1]) * SIEVE_SEGMENT_SIZE
+        for p in base_primes:
+            if p * p >= high:
+                break
+            start = max(p * p, (low + p - 1) // p * p)
+            segment[start - low::p] = bytes(len(range(start - low, SIEVE_SEGMENT_SIZE, p)))
+        if low == 0:
+            segment[0] = segment[1] = 0
+
+        # Answer every value that falls inside this segment with one lookup
+        while i < len(values) and values[i] < high:
+            if weights is None:
+                count += segment[values[i] - low]
+            else:
+                count += segment[values[i] - low] * weights[i]
+            i += 1
+    return count
+
+def is_prime_miller_rabin(n):
+    """Deterministic Miller-Rabin test for every 64-bit integer."""
+    if n < 2:
+        return False
+    for p in PREFILTER_PRIMES:
+        if n % p == 0:
+            return n == p
+
+    # Write n - 1 as d * 2^s with d odd
+    d = n - 1
+    s = 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+
+    for a in SMALL_PRIMES:
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+def load_numpy():
+    """
+    Import NumPy on first use and return it, or None if it is not installed.
+    Importing it lazily keeps the modules pool workers load small.
+    """
+    global _numpy
+    if _numpy is False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy = numpy
+    return _numpy
+
+def gil_enabled():
+    """False on a free-threaded interpreter running without the GIL."""
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return True if is_gil_enabled is None else is_gil_enabled()
+
+def numpy_prime_table(limit):
+    """
+    Boolean primality table covering 0..limit, built once and shared by
+    every thread; it is rebuilt twice as large when a bigger limit is asked.
+    """
+    global _numpy_table
+    np = load_numpy()
+    table = _numpy_table
+    if table is not None and len(table) > limit:
+        return table
+    with _numpy_table_lock:
+        if _numpy_table is None or len(_numpy_table) <= limit:
+            table = np.ones(1 << max(limit.bit_length(), 16), dtype=bool)
+            table[:2] = False
+            for p in range(2, isqrt(len(table) - 1) + 1):
+                if table[p]:
+                    table[p * p::p] = False
+            _numpy_table = table
+        return _numpy_table
+
+def prime_flags_numpy(numbers):
+    """
+    Boolean array telling which of numbers are prime, from NumPy lookups into
+    the shared prime table. Masking and gathering run in C without the GIL,
+    so threads calling this scale across cores; values too large for the
+    table fall back to Miller-Rabin.
+    """
+    np = load_numpy()
+    values = np.asarray(numbers, dtype=np.int64)
+    flags = np.zeros(len(values), dtype=bool)
+    in_table = (values >= 0) & (values < NUMPY_TABLE_MAX_VALUE)
+    small = values[in_table]
+    if small.size:
+        flags[in_table] = numpy_prime_table(int(small.max()))[small]
+    large = np.flatnonzero(~in_table & (values > 1))
+    flags[large] = [is_prime_miller_rabin(n) for n in values[large].tolist()]
+    return flags
+
+def count_primes_numpy(numbers):
+    """Count the primes in numbers with prime_flags_numpy."""
+    return int(load_numpy().count_nonzero(prime_flags_numpy(numbers)))
@@ -0,0 +1,184 @@
+import argparse
+import mmap
+import os
+import struct
+import threading
+
+from primality import sieve_primes_up_to
+
+try:
+    import fcntl
+except ImportError:  # Windows: counters are updated without a file lock
+    fcntl = None
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "prime_cache")
+# Values below this are answered from a precomputed primality bitmap
+DENSE_LIMIT = 1 << 26
+# Slots in the hashed store for larger values (a power of two, 16 bytes each)
+SPARSE_CAPACITY = 1 << 20
+
+# Dense bitmap layout: magic, bitmap limit, then one bit per value
+DENSE_MAGIC = b'PRIMEBM1'
+DENSE_HEADER = struct.Struct('<8sQ')
+# Hashed store layout: magic, slot count, hit and miss totals, then the slots
+SPARSE_MAGIC = b'PRIMEHS1'
+SPARSE_HEADER = struct.Struct('<8sQQQ')
+SLOT = struct.Struct('<QQ')
+
+# Each slot holds (value, value ^ salt); the salt encodes the result and lets
+# readers reject empty slots and slots torn by a concurrent writer
+PRIME_SALT = 0x9E3779B97F4A7C15
+COMPOSITE_SALT = 0xC2B2AE3D27D4EB4F
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+MASK64 = (1 << 64) - 1
+
+# Caches opened by this process, keyed by directory
+_caches = {}
+
+def get_cache(cache_dir=DEFAULT_CACHE_DIR):
+    """Return this process's PrimeCache for cache_dir, opening it on first use."""
+    cache = _caches.get(cache_dir)
+    if cache is None:
+        cache = _caches[cache_dir] = PrimeCache(cache_dir)
+    return cache
+
+def _replace_file(path, data):
+    """Atomically write data to path through a private temporary file."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as file:
+        file.write(data)
+    os.replace(tmp_path, path)
+
+def _create_file(path, data):
+    """Create path with data unless another process already created it."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as file:
+        file.write(data)
+    try:
+        os.link(tmp_path, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(tmp_path)
+
+def _has_header(path, header, magic):
+    """Return the header fields of path, or None if it is missing or foreign."""
+    try:
+        with open(path, 'rb') as file:
+            fields = header.unpack(file.read(header.size))
+    except (OSError, struct.error):
+        return None
+    return fields if fields[0] == magic else None
+
+class PrimeCache:
+    """
+    Persistent primality results shared by every process that opens cache_dir.
+    Values below dense_limit come from a bitmap built once with a sieve.
+    Larger values go to a fixed-size hashed store where each value has one
+    slot and a colliding insert evicts the previous entry. Both files are
+    memory-mapped, so all workers read and fill the same cache.
+    Hit and miss counters are kept per instance and accumulated on disk.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, dense_limit=DENSE_LIMIT,
+                 capacity=SPARSE_CAPACITY):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._counter_lock = threading.Lock()
+        self.dense_limit, self._dense = self._open_dense(dense_limit)
+        self._sparse_path = os.path.join(cache_dir, "sparse.bin")
+        self.capacity, self._sparse = self._open_sparse(capacity)
+        self._shift = 64 - self.capacity.bit_length() + 1
+
+    def _open_dense(self, limit):
+        """Map the dense bitmap, building it first if it is missing or too small."""
+        path = os.path.join(self.cache_dir, "dense.bin")
+        fields = _has_header(path, DENSE_HEADER, DENSE_MAGIC)
+        if fields is None or fields[1] < limit:
+            bits = bytearray((limit + 7) // 8)
+            for p in sieve_primes_up_to(limit - 1):
+                bits[p >> 3] |= 1 << (p & 7)
+            _replace_file(path, DENSE_HEADER.pack(DENSE_MAGIC, limit) + bits)
+        with open(path, 'rb') as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        _, stored_limit = DENSE_HEADER.unpack_from(mapped)
+        return stored_limit, memoryview(mapped)[DENSE_HEADER.size:]
+
+    def _open_sparse(self, capacity):
+        """Map the hashed store read-write, creating an empty one if needed."""
+        if _has_header(self._sparse_path, SPARSE_HEADER, SPARSE_MAGIC) is None:
+            header = SPARSE_HEADER.pack(SPARSE_MAGIC, capacity, 0, 0)
+            # Never replace a live store: other processes may have it mapped
+            _create_file(self._sparse_path, header + bytes(capacity * SLOT.size))
+        with open(self._sparse_path, 'r+b') as file:
+            mapped = mmap.mmap(file.fileno(), 0)
+        _, stored_capacity, _, _ = SPARSE_HEADER.unpack_from(mapped)
+        return stored_capacity, mapped
+
+    def _slot_offset(self, value):
+        # Fibonacci hashing spreads nearby values over the table
+        return SPARSE_HEADER.size + (((value * HASH_MULTIPLIER) & MASK64) >> self._shift) * SLOT.size
+
+    def count_primes(self, chunk, is_prime):
+        """Count the primes in chunk, calling is_prime only for values not cached yet."""
+        dense = self._dense
+        limit = self.dense_limit
+        sparse = self._sparse
+        count = 0
+        misses = 0
+        for n in chunk:
+            if n < limit:
+                if n > 1:
+                    count += dense[n >> 3] >> (n & 7) & 1
+                continue
+            if n > MASK64:
+                # Too large for a slot; not worth caching anyway
+                misses += 1
+                count += is_prime(n)
+                continue
+            offset = self._slot_offset(n)
+            stored, tag = SLOT.unpack_from(sparse, offset)
+            if stored == n and tag == n ^ PRIME_SALT:
+                count += 1
+            elif stored == n and tag == n ^ COMPOSITE_SALT:
+                pass
+            else:
+                misses += 1
+                prime = is_prime(n)
+                SLOT.pack_into(sparse, offset, n, n ^ (PRIME_SALT if prime else COMPOSITE_SALT))
+                count += prime
+        self._record(len(chunk) - misses, misses)
+        return count
+
+    def _record(self, hits, misses):
+        """Add to this instance's counters and to the totals stored on disk."""
+        with self._counter_lock:
+            self.hits += hits
+            self.misses += misses
+        with open(self._sparse_path, 'r+b') as file:
+            if fcntl is not None:
+                fcntl.flock(file, fcntl.LOCK_EX)
+            magic, capacity, total_hits, total_misses = SPARSE_HEADER.unpack_from(self._sparse)
+            SPARSE_HEADER.pack_into(self._sparse, 0, magic, capacity,
+                                    total_hits + hits, total_misses + misses)
+
+    def stats(self):
+        """Hit and miss totals accumulated on disk across runs."""
+        _, _, hits, misses = SPARSE_HEADER.unpack_from(self._sparse)
+        return {"hits": hits, "misses": misses}
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the persistent primality cache counters.")
+    parser.add_argument("cache_dir", nargs="?", default=DEFAULT_CACHE_DIR, help="cache directory")
+    args = parser.parse_args()
+
+    stats = get_cache(args.cache_dir).stats()
+    lookups = stats["hits"] + stats["misses"]
+    hit_rate = stats["hits"] / lookups if lookups else 0.0
+    print(f"Cache directory: {args.cache_dir}")
+    print(f"Hits: {stats['hits']}  Misses: {stats['misses']}  Hit rate: {hit_rate:.2%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Prime-counting kernels run by pool workers, and the wrappers that split a
+worker's chunk across threads. Process pools import this module (not the
+plotting scripts) to unpickle their tasks, so it only pulls in the standard
+library and primality; NumPy and the primality cache are loaded the first
+time a kernel that needs them runs.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from math import ceil
+
+from primality import (MILLER_RABIN_THRESHOLD, count_primes_sieve, is_prime_miller_rabin,
+                        load_numpy, sieve_is_cheaper)
+
+def is_prime(n):
+    """Check if a number is prime."""
+    if n <= 1:
+        return False
+    if n <= 3:
+        return True
+    if n % 2 == 0 or n % 3 == 0:
+        return False
+    # Large values: O(log^3 n) Miller-Rabin instead of O(sqrt n) trial division
+    if n >= MILLER_RABIN_THRESHOLD:
+        return is_prime_miller_rabin(n)
+    i = 5
+    while i * i <= n:
+        if n % i == 0 or n % (i + 2) == 0:
+            return False
+        i += 6
+    return True
+
+def count_primes_in_chunk(chunk):
+    """Count prime numbers in a chunk of numbers."""
+    # Use the batch sieve when the value range makes it cheaper than trial division
+    if chunk and sieve_is_cheaper(len(chunk), max(chunk)):
+        return count_primes_sieve(chunk)
+    count = 0
+    for num in chunk:
+        if is_prime(num):
+            count += 1
+    return count
+
+def count_primes_in_chunk_weighted(task):
+    """Count primes in a (values, multiplicities) task, weighting each prime by its multiplicity."""
+    values, multiplicities = task
+    if values and sieve_is_cheaper(len(values), max(values)):
+        return count_primes_sieve(values, multiplicities)
+    return sum(m for n, m in zip(values, multiplicities) if is_prime(n))
+
+def count_primes_in_chunk_numpy(chunk):
+    """
+    Count prime numbers in a chunk with array-at-a-time trial division.
+    Each candidate divisor is applied as a mask to the whole surviving subset,
+    which shrinks as composites are eliminated, so the inner loop runs in C.
+    """
+    np = load_numpy()
+    arr = np.asarray(chunk, dtype=np.int64)
+
+    # Large values are cheaper to test one by one with Miller-Rabin
+    large = arr >= MILLER_RABIN_THRESHOLD
+    count = sum(1 for n in arr[large].tolist() if is_prime_miller_rabin(n))
+
+    arr = arr[~large & (arr > 1)]
+    count += np.count_nonzero(arr <= 3)
+    active = np.sort(arr[(arr % 2 != 0) & (arr % 3 != 0)])
+
+    d = 5
+    while active.size:
+        # Survivors below d*d have no divisor up to their square root
+        cut = np.searchsorted(active, d * d)
+        count += cut
+        active = active[cut:]
+        active = active[(active % d != 0) & (active % (d + 2) != 0)]
+        d += 6
+    return int(count)
+
+def count_primes_in_chunk_cached(chunk, cache_dir=None):
+    """Count prime numbers in a chunk through the persistent primality cache (default directory if None)."""
+    from prime_cache import get_cache
+    cache = get_cache() if cache_dir is None else get_cache(cache_dir)
+    return cache.count_primes(chunk, is_prime)
+
+def split_workload(numbers, num_workers):
+    """Split the numbers into equal chunks for each worker."""
+    chunk_size = ceil(len(numbers) / num_workers)
+    return [numbers[i:i + chunk_size] for i in range(0, len(numbers), chunk_size)]
+
+# Per-chunk kernels selectable by name
+CHUNK_COUNTERS = {
+    'python': count_primes_in_chunk,
+    'numpy': count_primes_in_chunk_numpy,
+    'cached': count_primes_in_chunk_cached,
+}
+
+def process_chunk_with_threads(chunk, num_threads, backend='python'):
+    """Process a chunk of data using threads to count primes."""
+    thread_chunks = split_workload(chunk, num_threads)
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        results = list(executor.map(CHUNK_COUNTERS[backend], thread_chunks))
+    return sum(results)
+
+def process_weighted_chunk_with_threads(task, num_threads):
+    """Process a (values, multiplicities) task using threads to count weighted primes."""
+    values, multiplicities = task
+    thread_tasks = zip(split_workload(values, num_threads), split_workload(multiplicities, num_threads))
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        results = list(executor.map(count_primes_in_chunk_weighted, thread_tasks))
+    return sum(results)
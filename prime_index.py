@@ -0,0 +1,154 @@
+import argparse
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+
+from dataset import load_dataset
+from parallel import unique_with_counts
+from primality import is_prime_miller_rabin, load_numpy, prime_flags_numpy
+
+# Index layout: magic, distinct primes, total prime occurrences, then the
+# distinct primes in ascending order and the running total of their
+# occurrences, both as little-endian signed 64-bit integers
+INDEX_MAGIC = b'PRIMEIX1'
+INDEX_HEADER = struct.Struct('<8sQQ')
+
+def build_index(numbers, index_path):
+    """
+    Write the index of the primes in numbers to index_path and return
+    (distinct primes, prime occurrences).
+    """
+    values, multiplicities = unique_with_counts(numbers)
+    np = load_numpy()
+    if np is not None:
+        flags = prime_flags_numpy(values)
+        primes = np.frombuffer(values, dtype=np.int64)[flags]
+        cumulative = np.cumsum(np.frombuffer(multiplicities, dtype=np.int64)[flags])
+        primes, cumulative = array('q', primes.tobytes()), array('q', cumulative.tobytes())
+    else:
+        primes, cumulative = array('q'), array('q')
+        total = 0
+        for n, m in zip(values, multiplicities):
+            if is_prime_miller_rabin(n):
+                total += m
+                primes.append(n)
+                cumulative.append(total)
+    total = cumulative[-1] if cumulative else 0
+    if sys.byteorder != 'little':
+        primes.byteswap()
+        cumulative.byteswap()
+    with open(index_path, 'wb') as out:
+        out.write(INDEX_HEADER.pack(INDEX_MAGIC, len(primes), total))
+        primes.tofile(out)
+        cumulative.tofile(out)
+    return len(primes), total
+
+class PrimeIndex:
+    """
+    Read-only view of a prime index file, memory-mapped so queries only touch
+    the pages they need. Membership and range counts are binary searches over
+    the sorted primes, with occurrences read from the running totals.
+    """
+
+    def __init__(self, index_path):
+        with open(index_path, 'rb') as file:
+            self._mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.distinct, self.total = INDEX_HEADER.unpack_from(self._mapped)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{index_path} is not a prime index")
+        body = memoryview(self._mapped)[INDEX_HEADER.size:]
+        if sys.byteorder == 'little':
+            values = body.cast('q')
+        else:
+            values = array('q', body)
+            values.byteswap()
+        self.primes = values[:self.distinct]
+        self.cumulative = values[self.distinct:2 * self.distinct]
+
+    def __len__(self):
+        return self.distinct
+
+    def _occurrences_before(self, i):
+        """Occurrences of the first i primes."""
+        return self.cumulative[i - 1] if i > 0 else 0
+
+    def count(self, n):
+        """How many times n occurred in the dataset as a prime (0 if it is not one)."""
+        i = bisect_left(self.primes, n)
+        if i < self.distinct and self.primes[i] == n:
+            return self.cumulative[i] - self._occurrences_before(i)
+        return 0
+
+    def __contains__(self, n):
+        return self.count(n) > 0
+
+    def count_range(self, low, high, distinct=False):
+        """Primes with low <= p <= high: occurrences, or distinct values with distinct."""
+        start = bisect_left(self.primes, low)
+        stop = bisect_right(self.primes, high)
+        if stop <= start:
+            return 0
+        if distinct:
+            return stop - start
+        return self._occurrences_before(stop) - self._occurrences_before(start)
+
+    def top(self, k):
+        """The k largest primes, largest first, as (prime, occurrences) pairs."""
+        return [(self.primes[i], self.cumulative[i] - self._occurrences_before(i))
+                for i in range(self.distinct - 1, max(self.distinct - k, 0) - 1, -1)]
+
+    def close(self):
+        self.primes = self.cumulative = None
+        self._mapped.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and query a persistent index of a dataset's primes.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="index the primes of a CSV or binary dataset")
+    build.add_argument("data_file")
+    build.add_argument("index_path")
+    info = commands.add_parser("info", help="show the index totals")
+    info.add_argument("index_path")
+    contains = commands.add_parser("contains", help="check whether values are indexed primes")
+    contains.add_argument("index_path")
+    contains.add_argument("values", type=int, nargs="+")
+    count_range = commands.add_parser("range", help="count the primes between two values (inclusive)")
+    count_range.add_argument("index_path")
+    count_range.add_argument("low", type=int)
+    count_range.add_argument("high", type=int)
+    top = commands.add_parser("top", help="list the largest primes")
+    top.add_argument("index_path")
+    top.add_argument("k", type=int)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        distinct, total = build_index(load_dataset(args.data_file), args.index_path)
+        print(f"Indexed {distinct} distinct primes ({total} occurrences) into {args.index_path}")
+        return
+    with PrimeIndex(args.index_path) as index:
+        if args.command == "info":
+            print(f"{index.distinct} distinct primes, {index.total} occurrences")
+            if index.distinct:
+                print(f"Smallest {index.primes[0]}, largest {index.primes[-1]}")
+        elif args.command == "contains":
+            for n in args.values:
+                occurrences = index.count(n)
+                print(f"{n}: {'prime, ' + str(occurrences) + ' occurrences' if occurrences else 'not an indexed prime'}")
+        elif args.command == "range":
+            print(f"{index.count_range(args.low, args.high)} prime occurrences "
+                  f"({index.count_range(args.low, args.high, distinct=True)} distinct) "
+                  f"in [{args.low}, {args.high}]")
+        elif args.command == "top":
+            for prime, occurrences in index.top(args.k):
+                print(f"{prime} ({occurrences})")
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,16 @@
+import argparse
 import csv
 import time
 import os
 import threading
-import matplotlib.pyplot as plt
 from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from math import ceil
+from primality import count_primes_numpy, count_primes_sieve, gil_enabled, load_numpy, sieve_is_cheaper
+from dataset import (DEFAULT_CHUNK_SIZE, BinaryDataset, count_primes_streaming,
+                     is_binary_dataset, iter_dataset_chunks)
+import metrics
+from metrics import timed_phase
 
 def is_prime(n):
     """Check if a number is prime."""
@@ -22,7 +28,12 @@ def is_prime(n):
     return True
 
 def load_numbers_from_csv(file_path):
-    """Load numbers from the CSV file."""
+    """Load numbers from the CSV file (or map a binary dataset)."""
+    if is_binary_dataset(file_path):
+        # Binary datasets are memory-mapped instead of parsed
+        dataset = BinaryDataset(file_path)
+        print(f"Mapped {len(dataset)} numbers from binary dataset {file_path}.")
+        return dataset
     numbers = []
     try:
         print(f"Attempting to load numbers from {file_path}...")
@@ -76,22 +87,43 @@ def split_workload(numbers, num_workers):
 
 def count_primes_in_chunk(chunk):
     """Count prime numbers in a chunk of numbers."""
+    # Use the batch sieve when the value range makes it cheaper than trial division
+    if chunk and sieve_is_cheaper(len(chunk), max(chunk)):
+        return count_primes_sieve(chunk)
     count = 0
     for num in chunk:
         if is_prime(num):
             count += 1
     return count
 
-def count_primes_with_threads(numbers, num_threads):
+# Per-chunk kernels selectable by name; 'numpy' does its work without holding the GIL
+CHUNK_COUNTERS = {
+    'python': count_primes_in_chunk,
+    'numpy': count_primes_numpy,
+}
+
+def resolve_backend(backend='auto'):
+    """
+    Pick the kernel name for 'auto': pure Python already scales on a
+    free-threaded interpreter, otherwise the GIL-releasing NumPy kernel.
+    """
+    if backend != 'auto':
+        return backend
+    if not gil_enabled() or load_numpy() is None:
+        return 'python'
+    return 'numpy'
+
+def count_primes_with_threads(numbers, num_threads, backend='auto'):
     """Count prime numbers using multiple threads."""
     chunks = split_workload(numbers, num_threads)
     results = [0] * num_threads
+    count_fn = CHUNK_COUNTERS[resolve_backend(backend)]
     
     def worker(idx, chunk):
-        results[idx] = count_primes_in_chunk(chunk)
+        results[idx] = count_fn(chunk)
     
     threads = []
-    for i in range(num_threads):
+    for i in range(len(chunks)):
         thread = threading.Thread(target=worker, args=(i, chunks[i]))
         threads.append(thread)
         thread.start()
@@ -101,16 +133,31 @@ def count_primes_with_threads(numbers, num_threads):
     
     return sum(results)
 
-def count_primes_with_threadpool(numbers, num_threads):
-    """Count prime numbers using ThreadPoolExecutor."""
-    chunks = split_workload(numbers, num_threads)
+def count_primes_with_threadpool(numbers, num_threads, metrics=None, backend='auto'):
+    """Count prime numbers using ThreadPoolExecutor (recording per-thread work into metrics if given)."""
+    with timed_phase(metrics, 'split'):
+        chunks = split_workload(numbers, num_threads)
     
+    count_fn = CHUNK_COUNTERS[resolve_backend(backend)]
+    if metrics is not None:
+        count_fn = partial(metrics.call, count_fn)
     with ThreadPoolExecutor(max_workers=num_threads) as executor:
-        results = list(executor.map(count_primes_in_chunk, chunks))
+        with timed_phase(metrics, 'compute'):
+            results = list(executor.map(count_fn, chunks))
     
     return sum(results)
 
-def benchmark_threads(numbers, max_threads=16):
+def count_primes_with_threadpool_streaming(file_path, num_threads, chunk_size=DEFAULT_CHUNK_SIZE,
+                                           max_in_flight=None, metrics=None, backend='auto'):
+    """Count primes in a CSV or binary dataset, streaming bounded chunks to a thread pool."""
+    if max_in_flight is None:
+        max_in_flight = 2 * num_threads
+    chunks = iter_dataset_chunks(file_path, chunk_size)
+    count_fn = CHUNK_COUNTERS[resolve_backend(backend)]
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        return count_primes_streaming(executor, chunks, count_fn, max_in_flight, metrics)
+
+def benchmark_threads(numbers, max_threads=16, metrics=None, backend='auto'):
     """Benchmark different numbers of threads."""
     thread_counts = list(range(1, max_threads + 1))
     times = []
@@ -118,7 +165,7 @@ def benchmark_threads(numbers, max_threads=16):
     for num_threads in thread_counts:
         print(f"Testing with {num_threads} threads...")
         start_time = time.time()
-        prime_count = count_primes_with_threadpool(numbers, num_threads)
+        prime_count = count_primes_with_threadpool(numbers, num_threads, metrics, backend)
         end_time = time.time()
         
         processing_time = end_time - start_time
@@ -130,6 +177,8 @@ def benchmark_threads(numbers, max_threads=16):
 
 def plot_results(thread_counts, times):
     """Plot the results of the benchmark."""
+    # Imported here so the counting code can be used without loading matplotlib
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(10, 6))
     plt.plot(thread_counts, times, marker='o')
     plt.title('Prime Number Counting Performance with Threads')
@@ -140,12 +189,42 @@ def plot_results(thread_counts, times):
     print(f"Plot saved as 'thread_performance.png'")
     plt.close()
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Count primes in a CSV file with threads.")
+    parser.add_argument("csv_path", nargs="?", default="/home/isard/Descargas/numeros_aleatorios.csv",
+                        help="CSV or binary dataset to process")
+    parser.add_argument("--stream", action="store_true",
+                        help="stream the file in bounded chunks instead of loading it whole")
+    parser.add_argument("--threads", type=int, default=os.cpu_count(),
+                        help="worker threads for --stream")
+    parser.add_argument("--backend", choices=['auto', *sorted(CHUNK_COUNTERS)], default="auto",
+                        help="per-chunk kernel (auto: NumPy unless the interpreter runs without the GIL)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="numbers per streamed chunk")
+    parser.add_argument("--max-in-flight", type=int, default=None,
+                        help="streamed chunks pending at once (default: 2 per thread)")
+    metrics.add_arguments(parser)
+    return parser.parse_args()
+
 def main():
-    # Path to CSV file
-    csv_path = "/home/isard/Descargas/numeros_aleatorios.csv"
+    args = parse_args()
+    csv_path = args.csv_path
+    run_metrics = metrics.from_args('program2_threads', args)
+    backend = resolve_backend(args.backend)
+    print(f"Using the {backend} kernel ({'GIL enabled' if gil_enabled() else 'free-threaded interpreter'})")
+
+    if args.stream:
+        print(f"Streaming {csv_path} with {args.threads} threads...")
+        start_time = time.time()
+        prime_count = count_primes_with_threadpool_streaming(
+            csv_path, args.threads, args.chunk_size, args.max_in_flight, run_metrics, backend)
+        print(f"Found {prime_count} primes in {time.time() - start_time:.4f} seconds")
+        metrics.export(run_metrics, args)
+        return
     
     # Load numbers from CSV
-    numbers = load_numbers_from_csv(csv_path)
+    with timed_phase(run_metrics, 'load'):
+        numbers = load_numbers_from_csv(csv_path)
     if not numbers:
         print("No numbers loaded. Exiting.")
         return
@@ -153,7 +232,7 @@ def main():
     print(f"Loaded {len(numbers)} numbers from CSV.")
     
     # Benchmark different numbers of threads
-    thread_counts, times = benchmark_threads(numbers)
+    thread_counts, times = benchmark_threads(numbers, metrics=run_metrics, backend=backend)
     
     # Plot the results
     plot_results(thread_counts, times)
@@ -166,6 +245,7 @@ def main():
     print("\n--- Benchmark Results (Threads) ---")
     print(f"Optimal number of threads: {optimal_threads}")
     print(f"Best processing time: {optimal_time:.4f} seconds")
+    metrics.export(run_metrics, args)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
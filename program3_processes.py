@@ -1,43 +1,33 @@
-import csv
+import argparse
 import time
 import os
 import multiprocessing as mp
-import matplotlib.pyplot as plt
 from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from math import ceil
-
-def is_prime(n):
-    """Check if a number is prime."""
-    if n <= 1:
-        return False
-    if n <= 3:
-        return True
-    if n % 2 == 0 or n % 3 == 0:
-        return False
-    i = 5
-    while i * i <= n:
-        if n % i == 0 or n % (i + 2) == 0:
-            return False
-        i += 6
-    return True
+from prime_core import count_primes_in_chunk, count_primes_in_chunk_cached, count_primes_in_chunk_weighted
+from dataset import (DEFAULT_CHUNK_SIZE, BinaryDataset, count_primes_streaming,
+                     is_binary_dataset, iter_dataset_chunks, load_dataset)
+from prime_cache import get_cache
+from parallel import (TASKS_PER_WORKER, WorkerPool, count_deduplicated, make_balanced_tasks,
+                      share_numbers, sum_as_completed)
+from checkpoint import count_primes_incremental
+from prime_index import build_index
+import metrics
+from metrics import timed_phase
 
 def load_numbers_from_csv(file_path):
-    """Load numbers from the CSV file."""
-    numbers = []
+    """Load numbers from the CSV file (or map a binary dataset)."""
+    if is_binary_dataset(file_path):
+        # Binary datasets are memory-mapped instead of parsed
+        dataset = BinaryDataset(file_path)
+        print(f"Mapped {len(dataset)} numbers from binary dataset {file_path}.")
+        return dataset
     try:
         print(f"Attempting to load numbers from {file_path}...")
-        with open(file_path, 'r') as file:
-            csv_reader = csv.reader(file)
-            row_count = 0
-            for row in csv_reader:
-                row_count += 1
-                for item in row:
-                    try:
-                        numbers.append(int(item))
-                    except ValueError:
-                        # Skip non-integer values
-                        pass
-        print(f"Read {row_count} rows from CSV file.")
+        # Byte ranges of the file are parsed by one process per core
+        numbers = load_dataset(file_path)
+        print(f"Parsed {len(numbers)} numbers from CSV file.")
         return numbers
     except FileNotFoundError:
         print(f"Error: File {file_path} not found.")
@@ -53,14 +43,7 @@ def load_numbers_from_csv(file_path):
         for path in alternative_paths:
             if os.path.exists(path):
                 print(f"Found alternative file at {path}")
-                with open(path, 'r') as file:
-                    csv_reader = csv.reader(file)
-                    for row in csv_reader:
-                        for item in row:
-                            try:
-                                numbers.append(int(item))
-                            except ValueError:
-                                pass
+                numbers = load_dataset(path)
                 print(f"Loaded {len(numbers)} numbers from alternative path.")
                 return numbers
         
@@ -74,45 +57,95 @@ def split_workload(numbers, num_workers):
     chunk_size = ceil(len(numbers) / num_workers)
     return [numbers[i:i + chunk_size] for i in range(0, len(numbers), chunk_size)]
 
-def count_primes_in_chunk(chunk):
-    """Count prime numbers in a chunk of numbers."""
-    count = 0
-    for num in chunk:
-        if is_prime(num):
-            count += 1
-    return count
+def chunk_counter(cache_dir=None):
+    """Return the per-chunk function, going through the cache when cache_dir is set."""
+    if cache_dir is None:
+        return count_primes_in_chunk
+    # Build the cache files here once instead of in every worker
+    get_cache(cache_dir)
+    return partial(count_primes_in_chunk_cached, cache_dir=cache_dir)
 
-def count_primes_with_processpool(numbers, num_processes):
-    """Count prime numbers using ProcessPoolExecutor."""
-    chunks = split_workload(numbers, num_processes)
+def count_primes_with_processpool(numbers, num_processes, executor=None, scheduling='balanced',
+                                  cache_dir=None, dedupe=False, metrics=None):
+    """
+    Count prime numbers using ProcessPoolExecutor (or an already warm one).
+    With 'balanced' scheduling the work is cut into many cost-balanced tasks
+    handed out as workers free up; 'equal' keeps one equal-size chunk each.
+    With dedupe, each distinct value is tested once and weighted by its count.
+    Phases and per-worker work are recorded into metrics if given.
+    """
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=num_processes) as executor:
+            return count_primes_with_processpool(numbers, num_processes, executor, scheduling,
+                                                 cache_dir, dedupe, metrics)
     
-    with ProcessPoolExecutor(max_workers=num_processes) as executor:
-        results = list(executor.map(count_primes_in_chunk, chunks))
+    if dedupe:
+        return count_deduplicated(executor, count_primes_in_chunk_weighted, numbers,
+                                  num_processes * TASKS_PER_WORKER, metrics)
     
-    return sum(results)
+    count_fn = chunk_counter(cache_dir)
+    # Workers get (offset, length) descriptors into one shared buffer
+    with share_numbers(numbers, metrics) as shared:
+        with timed_phase(metrics, 'split'):
+            if scheduling == 'balanced':
+                chunks = make_balanced_tasks(shared, num_processes * TASKS_PER_WORKER)
+            else:
+                chunks = split_workload(shared, num_processes)
+        return sum_as_completed(executor, count_fn, chunks, metrics)
+
+def count_primes_with_processpool_streaming(file_path, num_processes, chunk_size=DEFAULT_CHUNK_SIZE,
+                                            max_in_flight=None, cache_dir=None, metrics=None, incremental=False):
+    """
+    Count primes in a CSV or binary dataset, streaming bounded chunks to a process pool.
+    With incremental, only the part of a CSV file appended since the last run is read.
+    """
+    if max_in_flight is None:
+        max_in_flight = 2 * num_processes
+    with ProcessPoolExecutor(max_workers=num_processes) as executor:
+        count_chunks = partial(count_primes_streaming, executor, count_fn=chunk_counter(cache_dir),
+                               max_in_flight=max_in_flight, metrics=metrics)
+        if incremental:
+            return count_primes_incremental(file_path, count_chunks, chunk_size=chunk_size).primes
+        return count_chunks(iter_dataset_chunks(file_path, chunk_size))
 
-def benchmark_processes(numbers):
-    """Benchmark from 1 to 12 processes."""
+def benchmark_processes(numbers, cache_dir=None, dedupe=False, metrics=None):
+    """
+    Benchmark from 1 to 12 processes.
+    The data is shared once and the pool stays warm, so the reported times
+    are steady-state compute; pool startup is returned separately.
+    """
     process_counts = list(range(1, 13))  # 1 to 12 processes
     times = []
     prime_counts = []
+    startup_times = []
     
-    for num_processes in process_counts:
-        print(f"Testing with {num_processes} processes...")
-        start_time = time.time()
-        prime_count = count_primes_with_processpool(numbers, num_processes)
-        end_time = time.time()
-        
-        processing_time = end_time - start_time
-        times.append(processing_time)
-        prime_counts.append(prime_count)
-        
-        print(f"  Found {prime_count} primes in {processing_time:.4f} seconds")
+    with share_numbers(numbers, metrics) as shared, WorkerPool() as pool:
+        # Start the largest pool once; smaller runs only limit its concurrency
+        with timed_phase(metrics, 'pool_startup'):
+            startup_time = pool.resize(max(process_counts))
+        for num_processes in process_counts:
+            print(f"Testing with {num_processes} processes...")
+            pool.resize(num_processes)
+            startup_times.append(startup_time)
+            startup_time = 0.0
+            start_time = time.time()
+            prime_count = count_primes_with_processpool(shared, num_processes, pool.executor,
+                                                        cache_dir=cache_dir, dedupe=dedupe, metrics=metrics)
+            end_time = time.time()
+            
+            processing_time = end_time - start_time
+            times.append(processing_time)
+            prime_counts.append(prime_count)
+            
+            print(f"  Found {prime_count} primes in {processing_time:.4f} seconds "
+                  f"(pool startup {startup_times[-1]:.4f} seconds)")
     
-    return process_counts, times, prime_counts
+    return process_counts, times, prime_counts, startup_times
 
 def plot_results(process_counts, times):
     """Plot the results of the benchmark."""
+    # Imported here so pool workers, which import this module, never load matplotlib
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(12, 7))
     plt.plot(process_counts, times, marker='o', linewidth=2, markersize=8)
     plt.title('Prime Number Counting Performance vs Number of Processes', fontsize=14)
@@ -132,12 +165,64 @@ def plot_results(process_counts, times):
     print(f"Plot saved as 'process_performance.png'")
     plt.close()
 
+def print_cache_stats(cache_dir):
+    """Print the hit/miss totals of the primality cache, if one is used."""
+    if cache_dir is None:
+        return
+    stats = get_cache(cache_dir).stats()
+    print(f"Primality cache {cache_dir}: {stats['hits']} hits, {stats['misses']} misses (all runs)")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Count primes in a CSV file with processes.")
+    parser.add_argument("csv_path", nargs="?", default="numeros_aleatorios.csv",
+                        help="CSV or binary dataset to process (default: current directory)")
+    parser.add_argument("--stream", action="store_true",
+                        help="stream the file in bounded chunks instead of loading it whole")
+    parser.add_argument("--processes", type=int, default=mp.cpu_count(),
+                        help="worker processes for --stream")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="numbers per streamed chunk")
+    parser.add_argument("--max-in-flight", type=int, default=None,
+                        help="streamed chunks pending at once (default: 2 per process)")
+    parser.add_argument("--index", metavar="PATH",
+                        help="also write a queryable index of the primes found (see prime_index.py)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="with --stream, only read what was appended to the CSV since the last run")
+    parser.add_argument("--cache", metavar="DIR", default=None,
+                        help="answer primality from a persistent cache in DIR shared by all workers")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="test each distinct value once and weight it by its multiplicity")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    if args.stream and args.dedupe:
+        parser.error("--dedupe needs the whole dataset and cannot be used with --stream")
+    if args.stream and args.index:
+        parser.error("--index needs the whole dataset and cannot be used with --stream")
+    if args.incremental and not args.stream:
+        parser.error("--incremental only works with --stream")
+    if args.dedupe and args.cache:
+        parser.error("--dedupe tests each value once without the primality cache; drop --cache")
+    return args
+
 def main():
-    # Path to CSV file
-    csv_path = "numeros_aleatorios.csv"  # Modified to look in current directory first
+    args = parse_args()
+    csv_path = args.csv_path
+    run_metrics = metrics.from_args('program3_processes', args)
+
+    if args.stream:
+        print(f"Streaming {csv_path} with {args.processes} processes...")
+        start_time = time.time()
+        prime_count = count_primes_with_processpool_streaming(
+            csv_path, args.processes, args.chunk_size, args.max_in_flight, args.cache, run_metrics,
+            args.incremental)
+        print(f"Found {prime_count} primes in {time.time() - start_time:.4f} seconds")
+        print_cache_stats(args.cache)
+        metrics.export(run_metrics, args)
+        return
     
     # Load numbers from CSV
-    numbers = load_numbers_from_csv(csv_path)
+    with timed_phase(run_metrics, 'load'):
+        numbers = load_numbers_from_csv(csv_path)
     if not numbers:
         print("No numbers loaded. Generating random numbers for testing...")
         # Generate random numbers if no CSV is found
@@ -146,7 +231,8 @@ def main():
     print(f"Processing {len(numbers)} numbers...")
     
     # Benchmark different numbers of processes
-    process_counts, times, prime_counts = benchmark_processes(numbers)
+    process_counts, times, prime_counts, startup_times = benchmark_processes(numbers, args.cache, args.dedupe,
+                                                                               run_metrics)
     
     # Plot the results
     plot_results(process_counts, times)
@@ -163,12 +249,19 @@ def main():
     
     # Print detailed results
     print("\nDetailed results:")
-    print("Processes | Time (s) | Speedup")
-    print("-" * 35)
+    print("Processes | Time (s) | Speedup | Startup (s)")
+    print("-" * 49)
     base_time = times[0]  # Single process time as baseline
-    for proc, time in zip(process_counts, times):
-        speedup = base_time / time
-        print(f"{proc:^9d} | {time:^8.3f} | {speedup:^7.2f}x")
+    for proc, proc_time, startup in zip(process_counts, times, startup_times):
+        speedup = base_time / proc_time
+        print(f"{proc:^9d} | {proc_time:^8.3f} | {speedup:^7.2f}x | {startup:^11.3f}")
+    print(f"Total pool startup time: {sum(startup_times):.3f} seconds (excluded from compute times)")
+    print_cache_stats(args.cache)
+    if args.index:
+        with timed_phase(run_metrics, 'index'):
+            distinct, total = build_index(numbers, args.index)
+        print(f"Indexed {distinct} distinct primes ({total} occurrences) into {args.index}")
+    metrics.export(run_metrics, args)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
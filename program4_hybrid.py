@@ -1,45 +1,32 @@
-import csv
+import argparse
 import time
 import os
 import multiprocessing as mp
 import threading
-import matplotlib.pyplot as plt
-from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
-from math import ceil
-import numpy as np
-
-def is_prime(n):
-    """Check if a number is prime."""
-    if n <= 1:
-        return False
-    if n <= 3:
-        return True
-    if n % 2 == 0 or n % 3 == 0:
-        return False
-    i = 5
-    while i * i <= n:
-        if n % i == 0 or n % (i + 2) == 0:
-            return False
-        i += 6
-    return True
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from prime_core import CHUNK_COUNTERS, process_chunk_with_threads, process_weighted_chunk_with_threads
+from dataset import (DEFAULT_CHUNK_SIZE, BinaryDataset, count_primes_streaming,
+                     is_binary_dataset, iter_dataset_chunks, load_dataset)
+from prime_cache import get_cache
+from parallel import (TASKS_PER_WORKER, WorkerPool, count_deduplicated, make_balanced_tasks,
+                      share_numbers, sum_as_completed)
+import metrics
+from autotune import autotune, powers_of_two_up_to
+from metrics import timed_phase
 
 def load_numbers_from_csv(file_path):
-    """Load numbers from the CSV file."""
-    numbers = []
+    """Load numbers from the CSV file (or map a binary dataset)."""
+    if is_binary_dataset(file_path):
+        # Binary datasets are memory-mapped instead of parsed
+        dataset = BinaryDataset(file_path)
+        print(f"Mapped {len(dataset)} numbers from binary dataset {file_path}.")
+        return dataset
     try:
         print(f"Attempting to load numbers from {file_path}...")
-        with open(file_path, 'r') as file:
-            csv_reader = csv.reader(file)
-            row_count = 0
-            for row in csv_reader:
-                row_count += 1
-                for item in row:
-                    try:
-                        numbers.append(int(item))
-                    except ValueError:
-                        # Skip non-integer values
-                        pass
-        print(f"Read {row_count} rows from CSV file.")
+        # Byte ranges of the file are parsed by one process per core
+        numbers = load_dataset(file_path)
+        print(f"Parsed {len(numbers)} numbers from CSV file.")
         return numbers
     except FileNotFoundError:
         print(f"Error: File {file_path} not found.")
@@ -48,86 +35,149 @@ def load_numbers_from_csv(file_path):
         print(f"Error reading CSV file: {e}")
         return []
 
-def split_workload(numbers, num_workers):
-    """Split the numbers into equal chunks for each worker."""
-    chunk_size = ceil(len(numbers) / num_workers)
-    return [numbers[i:i + chunk_size] for i in range(0, len(numbers), chunk_size)]
+def tune_hybrid(numbers, retune=False, executor=None, fixed=None):
+    """
+    Return the fastest {'processes', 'threads', 'backend', 'tasks_per_worker'}
+    for numbers on this host, from the auto-tuner's cache or a calibration run.
+    Settings in fixed are kept as given and only the others are searched.
+    A given executor is calibrated as is, so fixed must then include its
+    'processes'; otherwise a warm pool is started just for the calibration.
+    """
+    fixed = dict(fixed or {})
+    if executor is not None and 'processes' not in fixed:
+        raise ValueError("tuning on a given executor needs its process count in fixed")
+    space = {
+        'backend': ['python', 'numpy'],
+        'processes': powers_of_two_up_to(mp.cpu_count()),
+        'threads': [1, 2, 4],
+        'tasks_per_worker': [2, TASKS_PER_WORKER, 32],
+    }
+    default = {'processes': mp.cpu_count(), 'threads': 1, 'backend': 'python',
+               'tasks_per_worker': TASKS_PER_WORKER}
+    for name, value in fixed.items():
+        space[name] = [value]
+        default[name] = value
+    # Partly fixed searches are cached apart from the full one
+    kind = 'hybrid'
+    if fixed:
+        kind += '[' + ','.join(f'{name}={value}' for name, value in sorted(fixed.items())) + ']'
 
-def count_primes_in_chunk(chunk):
-    """Count prime numbers in a chunk of numbers."""
-    count = 0
-    for num in chunk:
-        if is_prime(num):
-            count += 1
-    return count
+    def run_on(pool_executor, sample, config):
+        start_time = time.perf_counter()
+        count_primes_hybrid(sample, config['processes'], config['threads'], config['backend'],
+                            executor=pool_executor, tasks_per_worker=config['tasks_per_worker'])
+        return time.perf_counter() - start_time
 
-def count_primes_in_chunk_numpy(chunk):
-    """Count prime numbers in a chunk using NumPy for potential optimization."""
-    arr = np.array(chunk)
-    is_prime_arr = np.ones(len(arr), dtype=bool)
-    is_prime_arr[arr <= 1] = False
-    is_prime_arr[(arr % 2 == 0) & (arr != 2)] = False
-    is_prime_arr[(arr % 3 == 0) & (arr != 3)] = False
-    
-    for i in range(len(arr)):
-        if is_prime_arr[i]:
-            n = arr[i]
-            if n <= 3:
-                continue
-            limit = int(n**0.5) + 1
-            j = 5
-            while j <= limit:
-                if n % j == 0 or n % (j + 2) == 0:
-                    is_prime_arr[i] = False
-                    break
-                j += 6
-    return np.sum(is_prime_arr)
+    if executor is not None:
+        return autotune(kind, numbers, space, default, partial(run_on, executor), retune=retune)
+    with WorkerPool() as pool:
+        pool.resize(max(space['processes']))
 
-# Mover la función `process_chunk_with_threads` fuera de `count_primes_hybrid`
-def process_chunk_with_threads(chunk, num_threads):
-    """Process a chunk of data using threads to count primes."""
-    thread_chunks = split_workload(chunk, num_threads)
-    with ThreadPoolExecutor(max_workers=num_threads) as executor:
-        results = list(executor.map(count_primes_in_chunk, thread_chunks))
-    return sum(results)
+        def run(sample, config):
+            # Pool startup is not part of a configuration's cost
+            pool.resize(config['processes'])
+            return run_on(pool.executor, sample, config)
+        return autotune(kind, numbers, space, default, run, retune=retune)
 
-def count_primes_hybrid(numbers, num_processes, num_threads_per_process):
+def count_primes_hybrid(numbers, num_processes=None, num_threads_per_process=None, backend=None, executor=None,
+                        dedupe=False, metrics=None, tasks_per_worker=None):
     """
     Hybrid approach using both processes and threads.
-    First divides work among processes, then each process uses threads.
+    First divides work into cost-balanced tasks that processes take as they
+    free up, then each process splits its task among threads.
+    An already warm executor can be passed in to skip process startup;
+    num_processes must then be its size.
+    With dedupe, each distinct value is tested once and weighted by its count.
+    Phases and per-process work are recorded into metrics if given.
+    Without a process or thread count, the auto-tuner picks the settings
+    that were not given (on the given executor, if any).
     """
-    process_chunks = split_workload(numbers, num_processes)
+    if num_processes is None and executor is not None:
+        raise ValueError("num_processes is required with an executor")
+    if num_processes is None or num_threads_per_process is None:
+        given = {'processes': num_processes, 'threads': num_threads_per_process,
+                 'backend': backend, 'tasks_per_worker': tasks_per_worker}
+        config = tune_hybrid(numbers, executor=executor,
+                             fixed={name: value for name, value in given.items() if value is not None})
+        num_processes = config['processes']
+        num_threads_per_process = config['threads']
+        backend = config['backend']
+        tasks_per_worker = config['tasks_per_worker']
+    backend = backend or 'python'
+    num_tasks = num_processes * (tasks_per_worker or TASKS_PER_WORKER)
     
-    # Ejecutar procesos
-    with ProcessPoolExecutor(max_workers=num_processes) as executor:
-        results = list(executor.map(process_chunk_with_threads, process_chunks, [num_threads_per_process] * num_processes))
+    if dedupe:
+        count_fn = partial(process_weighted_chunk_with_threads, num_threads=num_threads_per_process)
+        if executor is not None:
+            return count_deduplicated(executor, count_fn, numbers, num_tasks, metrics)
+        with ProcessPoolExecutor(max_workers=num_processes) as executor:
+            return count_deduplicated(executor, count_fn, numbers, num_tasks, metrics)
     
-    return sum(results)
+    count_fn = partial(process_chunk_with_threads, num_threads=num_threads_per_process, backend=backend)
+    if backend == 'cached':
+        # Build the cache files here once instead of in every worker
+        get_cache()
+    # Workers get (offset, length) descriptors into one shared buffer
+    with share_numbers(numbers, metrics) as shared:
+        with timed_phase(metrics, 'split'):
+            process_chunks = make_balanced_tasks(shared, num_tasks)
+        
+        if executor is not None:
+            return sum_as_completed(executor, count_fn, process_chunks, metrics)
+        # Ejecutar procesos
+        with ProcessPoolExecutor(max_workers=num_processes) as executor:
+            return sum_as_completed(executor, count_fn, process_chunks, metrics)
 
-def benchmark_hybrid(numbers, max_processes=4, max_threads=4):
-    """Benchmark different combinations of processes and threads."""
+def count_primes_hybrid_streaming(file_path, num_processes, num_threads_per_process, backend='python',
+                                  chunk_size=DEFAULT_CHUNK_SIZE, max_in_flight=None, metrics=None):
+    """Count primes in a CSV or binary dataset, streaming bounded chunks to processes that use threads."""
+    if max_in_flight is None:
+        max_in_flight = 2 * num_processes
+    chunks = iter_dataset_chunks(file_path, chunk_size)
+    count_fn = partial(process_chunk_with_threads, num_threads=num_threads_per_process, backend=backend)
+    if backend == 'cached':
+        get_cache()
+    with ProcessPoolExecutor(max_workers=num_processes) as executor:
+        return count_primes_streaming(executor, chunks, count_fn, max_in_flight, metrics)
+
+def benchmark_hybrid(numbers, max_processes=4, max_threads=4, dedupe=False, metrics=None):
+    """
+    Benchmark different combinations of processes and threads.
+    The largest pool is started once and reused for every size; its startup
+    time is kept as the last field of the first result, apart from compute time.
+    """
     results = []
     
     max_processes = min(max_processes, mp.cpu_count())
     
-    for num_processes in range(1, max_processes + 1):
-        for num_threads in range(1, max_threads + 1):
-            total_workers = num_processes * num_threads
-            print(f"Testing with {num_processes} processes × {num_threads} threads = {total_workers} workers...")
-            
-            start_time = time.time()
-            prime_count = count_primes_hybrid(numbers, num_processes, num_threads)
-            end_time = time.time()
-            
-            processing_time = end_time - start_time
-            results.append((num_processes, num_threads, total_workers, processing_time, prime_count))
-            
-            print(f"  Found {prime_count} primes in {processing_time:.4f} seconds")
+    with share_numbers(numbers, metrics) as shared, WorkerPool() as pool:
+        with timed_phase(metrics, 'pool_startup'):
+            startup_time = pool.resize(max_processes)
+        for num_processes in range(1, max_processes + 1):
+            pool.resize(num_processes)
+            for num_threads in range(1, max_threads + 1):
+                total_workers = num_processes * num_threads
+                print(f"Testing with {num_processes} processes × {num_threads} threads = {total_workers} workers...")
+                
+                start_time = time.time()
+                prime_count = count_primes_hybrid(shared, num_processes, num_threads, executor=pool.executor,
+                                                  dedupe=dedupe, metrics=metrics)
+                end_time = time.time()
+                
+                processing_time = end_time - start_time
+                results.append((num_processes, num_threads, total_workers, processing_time, prime_count,
+                                startup_time))
+                # Startup is only paid by the first configuration
+                startup_time = 0.0
+                
+                print(f"  Found {prime_count} primes in {processing_time:.4f} seconds")
     
     return results
 
 def plot_hybrid_results(results):
     """Plot the results of the hybrid benchmark."""
+    # Imported here so modules that import this one (benchmark_suite) never load matplotlib
+    import matplotlib.pyplot as plt
     processes = [r[0] for r in results]
     threads = [r[1] for r in results]
     total_workers = [r[2] for r in results]
@@ -158,32 +208,90 @@ def plot_hybrid_results(results):
     
     plt.close('all')
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Count primes in a CSV file with processes and threads.")
+    parser.add_argument("csv_path", nargs="?", default="/home/isard/Descargas/numeros_aleatorios.csv",
+                        help="CSV or binary dataset to process")
+    parser.add_argument("--stream", action="store_true",
+                        help="stream the file in bounded chunks instead of loading it whole")
+    parser.add_argument("--processes", type=int, default=mp.cpu_count(),
+                        help="worker processes for --stream")
+    parser.add_argument("--threads", type=int, default=1,
+                        help="threads per process for --stream")
+    parser.add_argument("--backend", choices=sorted(CHUNK_COUNTERS), default="python",
+                        help="per-chunk kernel for --stream")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="numbers per streamed chunk")
+    parser.add_argument("--max-in-flight", type=int, default=None,
+                        help="streamed chunks pending at once (default: 2 per process)")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="test each distinct value once and weight it by its multiplicity")
+    parser.add_argument("--auto", action="store_true",
+                        help="run once with the auto-tuned configuration instead of benchmarking them all")
+    parser.add_argument("--retune", action="store_true",
+                        help="with --auto, calibrate again even if a tuned configuration is cached")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    if args.stream and args.dedupe:
+        parser.error("--dedupe needs the whole dataset and cannot be used with --stream")
+    return args
+
 def main():
-    # Path to CSV file
-    csv_path = "/home/isard/Descargas/numeros_aleatorios.csv"
+    args = parse_args()
+    csv_path = args.csv_path
+    run_metrics = metrics.from_args('program4_hybrid', args)
+
+    if args.stream:
+        print(f"Streaming {csv_path} with {args.processes} processes × {args.threads} threads...")
+        start_time = time.time()
+        prime_count = count_primes_hybrid_streaming(
+            csv_path, args.processes, args.threads, args.backend, args.chunk_size, args.max_in_flight,
+            run_metrics)
+        print(f"Found {prime_count} primes in {time.time() - start_time:.4f} seconds")
+        metrics.export(run_metrics, args)
+        return
     
     # Load numbers from CSV
-    numbers = load_numbers_from_csv(csv_path)
+    with timed_phase(run_metrics, 'load'):
+        numbers = load_numbers_from_csv(csv_path)
     if not numbers:
         print("No numbers loaded. Exiting.")
         return
     
     print(f"Loaded {len(numbers)} numbers from CSV.")
     
+    if args.auto:
+        config = tune_hybrid(numbers, retune=args.retune)
+        print(f"Using {config['processes']} processes × {config['threads']} threads, "
+              f"{config['backend']} backend, {config['tasks_per_worker']} tasks per process")
+        with WorkerPool() as pool:
+            with timed_phase(run_metrics, 'pool_startup'):
+                pool.resize(config['processes'])
+            start_time = time.perf_counter()
+            prime_count = count_primes_hybrid(numbers, config['processes'], config['threads'], config['backend'],
+                                              executor=pool.executor, dedupe=args.dedupe, metrics=run_metrics,
+                                              tasks_per_worker=config['tasks_per_worker'])
+            processing_time = time.perf_counter() - start_time
+        print(f"Found {prime_count} primes in {processing_time:.4f} seconds")
+        metrics.export(run_metrics, args)
+        return
+    
     # Benchmark hybrid approach
-    results = benchmark_hybrid(numbers)
+    results = benchmark_hybrid(numbers, dedupe=args.dedupe, metrics=run_metrics)
     
     # Plot the results
     plot_hybrid_results(results)
     
     # Find the optimal configuration
     optimal_result = min(results, key=lambda x: x[3])
-    optimal_processes, optimal_threads, total_workers, optimal_time, prime_count = optimal_result
+    optimal_processes, optimal_threads, total_workers, optimal_time, prime_count, _ = optimal_result
     
     print("\n--- Benchmark Results (Hybrid) ---")
     print(f"Optimal configuration: {optimal_processes} processes × {optimal_threads} threads = {total_workers} workers")
     print(f"Best processing time: {optimal_time:.4f} seconds")
     print(f"Total prime numbers found: {prime_count}")
+    print(f"Total pool startup time: {sum(r[5] for r in results):.4f} seconds (excluded from processing times)")
+    metrics.export(run_metrics, args)
 
 if __name__ == "__main__":
     main()
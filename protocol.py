@@ -0,0 +1,135 @@
+import asyncio
+import socket
+import struct
+import sys
+from array import array
+from typing import List, Sequence, Tuple
+
+from dataset import IndexRange
+
+# Every message starts with a 1-byte type and an 8-byte payload length
+HEADER = struct.Struct('!BQ')
+
+# Message types
+MSG_REQUEST_WORK = 1  # client asks for the next unit; no payload
+MSG_WORK = 2          # payload: UNIT struct followed by one batch of the unit's numbers
+                      # in the negotiated codec; a unit may span several WORK messages
+MSG_RESULT = 3        # payload: RESULT struct
+MSG_DONE = 4          # no work left; no payload
+MSG_HELLO = 5         # payload: comma-separated codec names (client offer, server choice)
+MSG_UNIT_END = 6      # payload: UNIT struct; the unit's last batch has been sent
+MSG_HEARTBEAT = 7     # payload: HEARTBEAT struct, sent periodically by clients
+MESSAGE_TYPES = frozenset({MSG_REQUEST_WORK, MSG_WORK, MSG_RESULT, MSG_DONE, MSG_HELLO, MSG_UNIT_END,
+                           MSG_HEARTBEAT})
+
+# Largest payload accepted from a peer; a header announcing more is treated
+# as a protocol error instead of allocating the buffer
+MAX_PAYLOAD = 1 << 28
+
+# Unit id that prefixes every work payload
+UNIT = struct.Struct('<Q')
+# Unit id, prime count and processing seconds reported by a client
+RESULT = struct.Struct('<Qqd')
+# CPU cores, pool processes and one-minute load average of a client
+HEARTBEAT = struct.Struct('<HHd')
+
+# Bytes received per recv_into call
+RECV_BUFFER_SIZE = 1 << 20
+
+def send_message(sock: socket.socket, msg_type: int, *parts) -> int:
+    """
+    Send one framed message whose payload is the concatenation of parts
+    (any bytes-like objects, sent without joining them). Returns bytes sent.
+    """
+    parts = [memoryview(part).cast('B') for part in parts]
+    length = sum(len(part) for part in parts)
+    sock.sendall(HEADER.pack(msg_type, length))
+    for part in parts:
+        sock.sendall(part)
+    return HEADER.size + length
+
+def recv_exact(sock: socket.socket, size: int) -> bytearray:
+    """Receive exactly size bytes straight into one preallocated buffer."""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:], min(size - received, RECV_BUFFER_SIZE))
+        if n == 0:
+            raise ConnectionError("Connection closed in the middle of a message")
+        received += n
+    return buffer
+
+def unpack_header(header) -> Tuple[int, int]:
+    """Return (type, payload length) of a message header, rejecting unknown types and oversized payloads."""
+    msg_type, length = HEADER.unpack(header)
+    if msg_type not in MESSAGE_TYPES:
+        raise ValueError(f"Unknown message type {msg_type}")
+    if length > MAX_PAYLOAD:
+        raise ValueError(f"Message payload of {length} bytes exceeds the {MAX_PAYLOAD}-byte limit")
+    return msg_type, length
+
+def recv_message(sock: socket.socket) -> Tuple[int, bytearray]:
+    """Receive one framed message and return (type, payload)."""
+    msg_type, length = unpack_header(recv_exact(sock, HEADER.size))
+    return msg_type, recv_exact(sock, length)
+
+async def read_message(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    """Read one framed message from an asyncio stream and return (type, payload)."""
+    msg_type, length = unpack_header(await reader.readexactly(HEADER.size))
+    return msg_type, await reader.readexactly(length)
+
+async def write_message(writer: asyncio.StreamWriter, msg_type: int, *parts) -> int:
+    """Write one framed message made of parts to an asyncio stream. Returns bytes sent."""
+    parts = [memoryview(part).cast('B') for part in parts]
+    length = sum(len(part) for part in parts)
+    writer.write(HEADER.pack(msg_type, length))
+    for part in parts:
+        writer.write(part)
+    await writer.drain()
+    return HEADER.size + length
+
+def pack_numbers(numbers: Sequence[int]):
+    """Return numbers as a buffer of little-endian int64, without copying when possible."""
+    if isinstance(numbers, IndexRange):
+        numbers = numbers.values
+    elif not (isinstance(numbers, array) and numbers.typecode == 'q'):
+        numbers = array('q', numbers)
+    if sys.byteorder != 'little':
+        numbers = array('q', numbers)
+        numbers.byteswap()
+    return memoryview(numbers)
+
+def unpack_numbers(payload):
+    """Wrap a received payload as int64 values (zero-copy on little-endian hosts)."""
+    if sys.byteorder == 'little':
+        return memoryview(payload).cast('q')
+    numbers = array('q', payload)
+    numbers.byteswap()
+    return memoryview(numbers)
+
+def unpack_work(payload: bytearray) -> Tuple[int, memoryview]:
+    """Split a work payload into (unit id, encoded numbers)."""
+    (unit_id,) = UNIT.unpack_from(payload)
+    return unit_id, memoryview(payload)[UNIT.size:]
+
+def unpack_unit_end(payload: bytearray) -> int:
+    return UNIT.unpack(payload)[0]
+
+def pack_heartbeat(cores: int, processes: int, load: float) -> bytes:
+    return HEARTBEAT.pack(cores, processes, load)
+
+def unpack_heartbeat(payload: bytearray) -> Tuple[int, int, float]:
+    return HEARTBEAT.unpack(payload)
+
+def pack_hello(codecs: Sequence[str]) -> bytes:
+    return ','.join(codecs).encode('ascii')
+
+def unpack_hello(payload: bytearray) -> List[str]:
+    return bytes(payload).decode('ascii').split(',')
+
+def pack_result(unit_id: int, prime_count: int, seconds: float) -> bytes:
+    return RESULT.pack(unit_id, prime_count, seconds)
+
+def unpack_result(payload: bytearray) -> Tuple[int, int, float]:
+    return RESULT.unpack(payload)
@@ -1,35 +1,39 @@
-import socket
-import csv
+import argparse
+import asyncio
+import itertools
 import time
 import os
-from typing import List, Tuple
-import math
-
-def split_file(filename: str, num_parts: int) -> List[List[int]]:
-    numbers = []
-    with open(filename, 'r') as f:
-        reader = csv.reader(f)
-        for row in reader:
-            numbers.extend(map(int, row))
-    
-    # Calculate split points
-    chunk_size = math.ceil(len(numbers) / num_parts)
-    return [numbers[i:i + chunk_size] for i in range(0, len(numbers), chunk_size)]
+import socket
+import statistics
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from dataset import is_binary_dataset, iter_csv_chunks_parallel, iter_dataset_chunks
+from compression import CODECS, DEFAULT_CODEC, encode_numbers, negotiate
+import metrics
+from protocol import (MSG_DONE, MSG_HEARTBEAT, MSG_HELLO, MSG_REQUEST_WORK, MSG_RESULT, MSG_UNIT_END,
+                      MSG_WORK, HEADER, MAX_PAYLOAD, UNIT, pack_hello, read_message, unpack_heartbeat, unpack_hello,
+                      unpack_result, write_message)
 
-def main():
-    # Server configuration
-    HOST = '10.20.20.101'  # Server IP
-    PORT = 65432
-    NUM_CLIENTS = 3
-
-    # Create server socket
-    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # Allow reuse of address
-    server_socket.bind((HOST, PORT))
-    server_socket.listen(NUM_CLIENTS)
-    
-    print(f"Server listening on {HOST}:{PORT}")
+# Server configuration
+HOST = '10.20.20.101'  # Server IP
+PORT = 65432
+# Numbers per work unit handed to a client
+UNIT_SIZE = 200_000
+# Numbers per WORK message; clients start computing on each batch as it arrives
+BATCH_SIZE = 25_000
+# Worst-case encoded bytes per number (a 64-bit varint), used to keep batches under MAX_PAYLOAD
+MAX_ENCODED_NUMBER_SIZE = 10
+# Seconds to let connected clients receive their "done" message before exiting
+SHUTDOWN_GRACE = 5
+# A unit is handed out again once it runs this many times longer than the median unit
+STRAGGLER_FACTOR = 3
+# Bounds on that deadline, and the deadline before any unit has finished
+MIN_UNIT_TIMEOUT = 5.0
+FIRST_UNIT_TIMEOUT = 60.0
+# A client that has sent heartbeats is dropped after this long without any message
+HEARTBEAT_TIMEOUT = 20.0
 
+def find_data_file() -> Optional[str]:
     # Try different possible locations for the CSV file
     possible_paths = [
         os.path.expanduser("~/Documentos/numeros_aleatorios.csv"),
@@ -37,64 +41,343 @@ def main():
         os.path.expanduser("~/Personal/numeros_aleatorios.csv")
     ]
     
-    file_path = None
     for path in possible_paths:
         if os.path.exists(path):
-            file_path = path
-            break
+            return path
+    return None
+
+class WorkQueue:
+    """
+    Hands out work units to whichever client asks next.
+    Units are read lazily from the source and kept until their first result
+    arrives; the next unit is read in a background thread while the current
+    one is handed out, so parsing never stalls the event loop. A unit still
+    running past its deadline is also handed to the next idle client;
+    whichever copy finishes first counts and later results for it are
+    discarded. Units whose clients all disconnect are queued again.
+    """
+
+    def __init__(self, units: Iterable[Sequence[int]], unit_timeout: Optional[float] = None):
+        self._source = iter(units)
+        self._ids = itertools.count()
+        self._lookahead = next(self._source, None)
+        self._reading: Optional[asyncio.Future] = None  # read of the next unit, while one runs
+        self._pending = deque()
+        self._changed = asyncio.Condition()
+        self._unit_times: List[float] = []
+        self.unit_timeout = unit_timeout
+        self.units: Dict[int, Sequence[int]] = {}  # unit id -> numbers, until completed
+        self.holders: Dict[int, Dict[int, float]] = {}  # unit id -> {client id: assigned at}
+        self.results: Dict[int, Tuple[int, float]] = {}
+        self.reassigned = 0
+        self.duplicates = 0
+        self.finished = asyncio.Event()
+        self.started_at: Optional[float] = None
+        self.read_time = 0.0  # seconds spent reading units from the source
+        if self._lookahead is None:
+            # Nothing to hand out: the job is done before any client connects
+            self.finished.set()
+
+    def _has_ready_work(self) -> bool:
+        return bool(self._pending) or self._lookahead is not None
+
+    def _has_work(self) -> bool:
+        return self._has_ready_work() or self._reading is not None
+
+    def _take(self) -> int:
+        if self._pending:
+            return self._pending.popleft()
+        unit_id = next(self._ids)
+        self.units[unit_id] = self._lookahead
+        self.holders[unit_id] = {}
+        self._lookahead = None
+        self._reading = asyncio.ensure_future(self._read_next())
+        return unit_id
+
+    async def _read_next(self):
+        """Read the next unit off the event loop, then wake clients waiting for work."""
+        start = time.perf_counter()
+        unit = await asyncio.get_running_loop().run_in_executor(None, next, self._source, None)
+        self.read_time += time.perf_counter() - start
+        async with self._changed:
+            self._lookahead = unit
+            self._reading = None
+            if not self.units and not self._has_work():
+                self.finished.set()
+            self._changed.notify_all()
+
+    def deadline(self) -> float:
+        """Seconds a unit may run before it is handed out again."""
+        if self.unit_timeout is not None:
+            return self.unit_timeout
+        if not self._unit_times:
+            return FIRST_UNIT_TIMEOUT
+        return max(MIN_UNIT_TIMEOUT, STRAGGLER_FACTOR * statistics.median(self._unit_times))
+
+    def _overdue(self, client_id: int, now: float) -> Tuple[Optional[int], Optional[float]]:
+        """Return the longest overdue unit client_id does not hold, and the seconds until the next deadline."""
+        limit = self.deadline()
+        best, best_due, next_due = None, None, None
+        for unit_id, holders in self.holders.items():
+            if not holders or client_id in holders:
+                continue
+            due = max(holders.values()) + limit
+            if due <= now:
+                if best_due is None or due < best_due:
+                    best, best_due = unit_id, due
+            elif next_due is None or due < next_due:
+                next_due = due
+        return best, None if next_due is None else next_due - now
+
+    async def get(self, client_id: int) -> Optional[Tuple[int, Sequence[int]]]:
+        """Wait for the next unit (new, requeued or overdue); None once every unit has a result."""
+        async with self._changed:
+            while not self.finished.is_set():
+                now = time.perf_counter()
+                if self._has_ready_work():
+                    unit_id = self._take()
+                    break
+                unit_id, wait_time = self._overdue(client_id, now)
+                if unit_id is not None:
+                    self.reassigned += 1
+                    print(f"Unit {unit_id} is overdue; also assigning it to client {client_id}")
+                    break
+                try:
+                    await asyncio.wait_for(self._changed.wait(), wait_time)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                return None
+            if self.started_at is None:
+                self.started_at = now
+            self.holders[unit_id][client_id] = now
+            return unit_id, self.units[unit_id]
+
+    async def complete(self, client_id: int, unit_id: int, primes: int, seconds: float) -> bool:
+        """Record a unit's result; returns False for a duplicate that lost the race."""
+        async with self._changed:
+            if unit_id not in self.units:
+                self.duplicates += 1
+                return False
+            assigned_at = self.holders.pop(unit_id).get(client_id)
+            if assigned_at is not None:
+                self._unit_times.append(time.perf_counter() - assigned_at)
+            self.results[unit_id] = (primes, seconds)
+            del self.units[unit_id]
+            if not self.units and not self._has_work():
+                self.finished.set()
+            self._changed.notify_all()
+            return True
+
+    async def release(self, client_id: int, unit_id: int):
+        """Forget that a departed client held unit_id; requeue it if nobody else does."""
+        async with self._changed:
+            holders = self.holders.get(unit_id)
+            if holders is None:
+                return
+            holders.pop(client_id, None)
+            if not holders and unit_id not in self._pending:
+                self._pending.append(unit_id)
+                self._changed.notify_all()
+
+class ClientStats:
+    def __init__(self, address):
+        self.address = address
+        self.units = 0
+        self.numbers = 0
+        self.busy_time = 0.0
+        self.codec = DEFAULT_CODEC
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.encode_time = 0.0
+        self.heartbeats = 0
+        self.cores = None
+        self.processes = None
+        self.load = None
+
+async def serve_client(queue: WorkQueue, client_id: int, stats: ClientStats,
+                       reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                       codecs: Sequence[str] = CODECS, batch_size: int = BATCH_SIZE):
+    """Answer one client's work requests until the job is done or the client leaves."""
+    loop = asyncio.get_running_loop()
+    assigned = {}  # unit id -> number count
+    try:
+        while True:
+            # Silence is only suspicious from clients known to send heartbeats
+            timeout = HEARTBEAT_TIMEOUT if stats.heartbeats else None
+            msg_type, payload = await asyncio.wait_for(read_message(reader), timeout)
+            stats.bytes_received += HEADER.size + len(payload)
+            if msg_type == MSG_HEARTBEAT:
+                stats.cores, stats.processes, stats.load = unpack_heartbeat(payload)
+                stats.heartbeats += 1
+            elif msg_type == MSG_HELLO:
+                # Use the client's most preferred codec that this server allows
+                stats.codec = negotiate(unpack_hello(payload), codecs)
+                await write_message(writer, MSG_HELLO, pack_hello([stats.codec]))
+                print(f"Client {client_id} uses codec {stats.codec}")
+            elif msg_type == MSG_REQUEST_WORK:
+                unit = await queue.get(client_id)
+                if unit is None:
+                    await write_message(writer, MSG_DONE)
+                    break
+                unit_id, numbers = unit
+                assigned[unit_id] = len(numbers)
+                header = UNIT.pack(unit_id)
+                # Stream the unit in batches so the client computes while the rest is in flight
+                for start in range(0, len(numbers), batch_size):
+                    batch = numbers[start:start + batch_size]
+                    # Encode off the event loop; zlib and lzma release the GIL
+                    began = time.perf_counter()
+                    encoded = await loop.run_in_executor(None, encode_numbers, batch, stats.codec)
+                    stats.encode_time += time.perf_counter() - began
+                    stats.bytes_sent += await write_message(writer, MSG_WORK, header, encoded)
+                stats.bytes_sent += await write_message(writer, MSG_UNIT_END, header)
+            elif msg_type == MSG_RESULT:
+                unit_id, primes, time_taken = unpack_result(payload)
+                if await queue.complete(client_id, unit_id, primes, time_taken):
+                    stats.units += 1
+                    stats.numbers += assigned.get(unit_id, 0)
+                    stats.busy_time += time_taken
+                else:
+                    print(f"Discarded late result for unit {unit_id} from client {client_id}")
+                assigned.pop(unit_id, None)
+            else:
+                raise ValueError(f"Unexpected message type {msg_type}")
+    except (asyncio.IncompleteReadError, ConnectionError) as e:
+        print(f"Client {client_id} left: {e}")
+    except asyncio.TimeoutError:
+        print(f"Client {client_id} missed its heartbeats; dropping it")
+    except asyncio.CancelledError:
+        # Job over while this client was still silent; it is not waited for
+        print(f"Dropping unresponsive client {client_id}")
+    except Exception as e:
+        print(f"Error with client {client_id}: {e}")
+    finally:
+        # Anything the client was still working on goes back to the queue
+        for unit_id in assigned:
+            await queue.release(client_id, unit_id)
+        writer.close()
+
+async def run_job(units: Iterable[Sequence[int]], host: str, port: int,
+                  unit_timeout: Optional[float] = None, codecs: Sequence[str] = CODECS,
+                  batch_size: int = BATCH_SIZE):
+    """
+    Serve work units to any number of clients until all are done.
+    Clients may connect or disconnect at any time; each asks for the next
+    unit when it is ready, so faster nodes automatically take more units,
+    and overdue units are re-run on idle clients.
+    Returns (queue, per-client stats, wall-clock seconds).
+    """
+    queue = WorkQueue(units, unit_timeout)
+    client_ids = itertools.count(1)
+    clients: List[ClientStats] = []
+    handlers = set()
     
+    async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        client_id = next(client_ids)
+        stats = ClientStats(writer.get_extra_info('peername'))
+        clients.append(stats)
+        print(f"Client {client_id} connected from {stats.address}")
+        # Let the OS notice peers that vanish without closing the connection
+        writer.get_extra_info('socket').setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        handlers.add(asyncio.current_task())
+        try:
+            await serve_client(queue, client_id, stats, reader, writer, codecs, batch_size)
+        finally:
+            handlers.discard(asyncio.current_task())
+    
+    server = await asyncio.start_server(handle_client, host, port, reuse_address=True)
+    async with server:
+        print(f"Server listening on {host}:{port}")
+        print("Waiting for clients to request work...")
+        await queue.finished.wait()
+        # No unit was ever handed out when the dataset is empty
+        wall_time = 0.0 if queue.started_at is None else time.perf_counter() - queue.started_at
+        # Give connected clients a moment to be told there is no more work
+        if handlers:
+            await asyncio.wait(set(handlers), timeout=SHUTDOWN_GRACE)
+        for handler in set(handlers):
+            handler.cancel()
+            await asyncio.wait([handler])
+    return queue, clients, wall_time
+
+def export_metrics(args, queue: WorkQueue, clients: List[ClientStats], wall_time: float):
+    """Write the job's metrics if requested; each client counts as one worker."""
+    run_metrics = metrics.from_args('server', args)
+    if run_metrics is None:
+        return
+    # Idle time is measured against the job's wall clock, not the server's uptime
+    run_metrics.wall_time = wall_time
+    run_metrics.add_phase('read', queue.read_time)
+    run_metrics.add_phase('job', wall_time)
+    for i, stats in enumerate(clients, 1):
+        host, port = stats.address[:2]
+        run_metrics.record_task(f"client{i}@{host}:{port}", stats.numbers, stats.busy_time, tasks=stats.units)
+        run_metrics.add_phase('encode', stats.encode_time)
+        run_metrics.add_bytes('sent', stats.bytes_sent)
+        run_metrics.add_bytes('received', stats.bytes_received)
+    metrics.export(run_metrics, args)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Distribute prime counting to clients that pull work units.")
+    parser.add_argument("data_file", nargs="?", default=None,
+                        help="CSV or binary dataset (default: search the usual locations)")
+    parser.add_argument("--host", default=HOST, help="address to listen on")
+    parser.add_argument("--port", type=int, default=PORT, help="port to listen on")
+    parser.add_argument("--unit-size", type=int, default=UNIT_SIZE, help="numbers per work unit")
+    parser.add_argument("--unit-timeout", type=float, default=None,
+                        help=f"seconds before an unfinished unit is also given to an idle client "
+                             f"(default: {STRAGGLER_FACTOR}x the median unit time)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="numbers per streamed message within a unit")
+    parser.add_argument("--codecs", default=",".join(CODECS),
+                        help="comma-separated payload codecs clients may choose from")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    if args.batch_size * MAX_ENCODED_NUMBER_SIZE > MAX_PAYLOAD - UNIT.size:
+        parser.error(f"--batch-size must be at most {(MAX_PAYLOAD - UNIT.size) // MAX_ENCODED_NUMBER_SIZE}")
+    return args
+
+def main():
+    args = parse_args()
+    file_path = args.data_file or find_data_file()
     if not file_path:
         print("Error: CSV file not found in any of the expected locations")
         return
 
     try:
-        # Split the data
-        data_chunks = split_file(file_path, NUM_CLIENTS)
+        # Units are read from the file lazily, as clients ask for them; CSV
+        # files are parsed a window at a time in parallel byte ranges
+        if is_binary_dataset(file_path):
+            units = iter_dataset_chunks(file_path, args.unit_size)
+        else:
+            units = iter_csv_chunks_parallel(file_path, args.unit_size)
+        queue, clients, wall_time = asyncio.run(run_job(units, args.host, args.port, args.unit_timeout,
+                                                              args.codecs.split(','), args.batch_size))
         
-        # Wait for all clients to connect
-        clients = []
-        addresses = []
-        
-        print(f"Waiting for {NUM_CLIENTS} clients to connect...")
-        
-        for i in range(NUM_CLIENTS):
-            client_socket, address = server_socket.accept()
-            print(f"Client {i+1} connected from {address}")
-            clients.append(client_socket)
-            addresses.append(address)
-
-        total_primes = 0
-        total_time = 0
-
-        # Send data to each client and receive results
-        for i, (client, chunk) in enumerate(zip(clients, data_chunks)):
-            try:
-                # Send data with terminating character
-                data_str = ','.join(map(str, chunk)) + '\n'
-                client.sendall(data_str.encode())
-                
-                # Receive results
-                result = client.recv(1024).decode().strip()
-                if result:
-                    primes, time_taken = map(float, result.split(','))
-                    total_primes += int(primes)
-                    total_time += time_taken
-                    print(f"Client {i+1} found {int(primes)} primes in {time_taken:.2f} seconds")
-            except Exception as e:
-                print(f"Error with client {i+1}: {e}")
-            finally:
-                client.close()
+        total_primes = sum(primes for primes, _ in queue.results.values())
+        # Client times overlap, so their sum is CPU-style work, not elapsed time
+        total_time = sum(time_taken for _, time_taken in queue.results.values())
 
         print(f"\nTotal Results:")
         print(f"Total prime numbers found: {total_primes}")
-        print(f"Total processing time: {total_time:.2f} seconds")
-        print(f"Average time per client: {total_time/NUM_CLIENTS:.2f} seconds")
+        print(f"Work units processed: {len(queue.results)}")
+        print(f"Units re-run after their deadline: {queue.reassigned} "
+              f"({queue.duplicates} duplicate results discarded)")
+        print(f"Job wall-clock time: {wall_time:.2f} seconds")
+        print(f"Sum of client processing times: {total_time:.2f} seconds")
+        for i, stats in enumerate(clients, 1):
+            print(f"  Client {i} {stats.address}: {stats.units} units, {stats.numbers} numbers, "
+                  f"{stats.busy_time:.2f} seconds busy")
+            print(f"    codec {stats.codec}: {stats.bytes_sent} bytes sent, "
+                  f"{stats.encode_time:.3f} seconds encoding")
+            if stats.heartbeats:
+                print(f"    last heartbeat: {stats.cores} cores, {stats.processes} processes, "
+                      f"load {stats.load:.2f}")
+        export_metrics(args, queue, clients, wall_time)
 
     except Exception as e:
         print(f"Server error: {e}")
-    finally:
-        # Close server socket
-        server_socket.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import importlib
+import multiprocessing as mp
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from parallel import WARM_UP_DELAY, _warm_up
+
+# Modules timed by default: the worker core, the entry points and the heavy
+# libraries they used to import at module level
+MODULES = ('prime_core', 'dataset', 'parallel', 'client', 'program2_threads', 'program3_processes',
+           'program4_hybrid', 'numpy', 'matplotlib.pyplot')
+# What a worker imported before the compute core was split out
+HEAVY_MODULES = ('numpy', 'matplotlib.pyplot')
+DEFAULT_REPEATS = 3
+
+def import_time(module, repeats=DEFAULT_REPEATS):
+    """Median cumulative import time of module in a fresh interpreter, in seconds (None if it fails)."""
+    times = []
+    for _ in range(repeats):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        if result.returncode != 0:
+            return None
+        # Last line: "import time: self | cumulative | module", in microseconds
+        times.append(int(result.stderr.strip().splitlines()[-1].split('|')[1]) / 1e6)
+    return statistics.median(times)
+
+def _import_modules(names):
+    for name in names:
+        importlib.import_module(name)
+
+def pool_startup(method, workers, preload=(), repeats=DEFAULT_REPEATS):
+    """
+    Median seconds until a pool of workers started with method has every
+    worker running, optionally after each one imports the preload modules.
+    """
+    context = mp.get_context(method)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_import_modules, initargs=(preload,)) as executor:
+            # One blocking task per worker forces every process to start and import now
+            list(executor.map(_warm_up, [WARM_UP_DELAY] * workers))
+            times.append(time.perf_counter() - start - WARM_UP_DELAY)
+    return statistics.median(times)
+
+def main():
+    parser = argparse.ArgumentParser(description="Report module import times and process pool startup costs.")
+    parser.add_argument("--modules", default=",".join(MODULES), help="comma-separated modules to time")
+    parser.add_argument("--workers", type=int, default=mp.cpu_count(), help="pool size for the startup test")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS, help="runs per measurement (median kept)")
+    args = parser.parse_args()
+
+    print("Module               | Import (ms)")
+    print("-" * 34)
+    for module in args.modules.split(','):
+        seconds = import_time(module, args.repeats)
+        print(f"{module:<20} | {'failed' if seconds is None else f'{seconds * 1000:.1f}':^11}")
+
+    print(f"\nPool startup with {args.workers} workers (until every worker has run a task):")
+    print("Start method | Core only (s) | With NumPy + matplotlib (s)")
+    print("-" * 56)
+    for method in mp.get_all_start_methods():
+        light = pool_startup(method, args.workers, repeats=args.repeats)
+        heavy = pool_startup(method, args.workers, HEAVY_MODULES, args.repeats)
+        print(f"{method:<12} | {light:^13.3f} | {heavy:^27.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Checks resuming and restarting incremental counts in checkpoint.py.
+Run with: python -m pytest -q
+"""
+import pytest
+
+from checkpoint import count_primes_incremental
+from dataset import convert_csv_to_binary
+from prime_core import is_prime
+
+class CountingChunks:
+    """count_chunks that records every number it was given."""
+
+    def __init__(self):
+        self.seen = []
+
+    def __call__(self, chunks):
+        primes = 0
+        for chunk in chunks:
+            self.seen.extend(chunk)
+            primes += sum(is_prime(n) for n in chunk)
+        return primes
+
+def count(path, checkpoint_dir):
+    counter = CountingChunks()
+    result = count_primes_incremental(str(path), counter, str(checkpoint_dir), chunk_size=4)
+    return result, counter.seen
+
+def test_appended_numbers_are_read_once(tmp_path):
+    path = tmp_path / 'numbers.csv'
+    path.write_text('numero\n2,3,4\n5,6,7\n')
+    result, seen = count(path, tmp_path)
+    assert (result.primes, result.numbers, result.resumed) == (4, 6, False)
+    assert seen == [2, 3, 4, 5, 6, 7]
+
+    with open(path, 'a') as file:
+        file.write('11,12\n13\n')
+    result, seen = count(path, tmp_path)
+    assert (result.primes, result.numbers, result.resumed) == (6, 9, True)
+    assert result.new_bytes == len('11,12\n13\n')
+    assert seen == [11, 12, 13]
+
+def test_unterminated_last_field_is_read_again(tmp_path):
+    path = tmp_path / 'numbers.csv'
+    path.write_text('numero\n2,4,13')
+    result, seen = count(path, tmp_path)
+    assert (result.primes, result.numbers) == (2, 3)
+
+    # The field kept growing: 13 became 137, which is still prime
+    with open(path, 'a') as file:
+        file.write('7,8\n')
+    result, seen = count(path, tmp_path)
+    assert (result.primes, result.numbers, result.resumed) == (2, 4, True)
+    assert seen == [137, 8]
+
+def test_changed_prefix_is_counted_from_the_start(tmp_path):
+    path = tmp_path / 'numbers.csv'
+    path.write_text('numero\n2,3,4\n5,6,7\n')
+    count(path, tmp_path)
+
+    path.write_text('numero\n8,9,10\n11,12,13\n')
+    result, seen = count(path, tmp_path)
+    assert (result.primes, result.numbers, result.resumed) == (2, 6, False)
+    assert seen == [8, 9, 10, 11, 12, 13]
+    # The fresh checkpoint is used by the next run
+    result, seen = count(path, tmp_path)
+    assert (result.primes, result.resumed, seen) == (2, True, [])
+
+def test_truncated_file_is_counted_from_the_start(tmp_path):
+    path = tmp_path / 'numbers.csv'
+    path.write_text('numero\n2,3,4\n5,6,7\n')
+    count(path, tmp_path)
+
+    path.write_text('numero\n2,3\n')
+    result, seen = count(path, tmp_path)
+    assert (result.primes, result.numbers, result.resumed) == (2, 2, False)
+
+def test_binary_dataset_is_rejected(tmp_path):
+    csv_path = tmp_path / 'numbers.csv'
+    csv_path.write_text('numero\n2,3\n')
+    binary_path = tmp_path / 'numbers.bin'
+    convert_csv_to_binary(str(csv_path), str(binary_path))
+    with pytest.raises(ValueError, match="CSV"):
+        count(binary_path, tmp_path)
@@ -0,0 +1,52 @@
+"""
+Checks CSV byte-range splitting and the parallel CSV parsers in dataset.py.
+Run with: python -m pytest -q
+"""
+import random
+
+import dataset
+from dataset import csv_byte_ranges, iter_csv_chunks_parallel, iter_number_chunks, parse_byte_range, parse_csv_parallel
+
+def write_numbers(path, count=3000, seed=4):
+    rng = random.Random(seed)
+    numbers = [rng.randrange(-(1 << 63), 1 << 63) for _ in range(count)]
+    rows = [','.join(map(str, numbers[i:i + 7])) for i in range(0, count, 7)]
+    path.write_text('numero\n' + '\n'.join(rows) + '\n')
+    return numbers
+
+def test_csv_byte_ranges_at_every_split_count(tmp_path):
+    path = tmp_path / 'numbers.csv'
+    path.write_bytes(b'numero\n12,,7\r\n-3,100\n\n5\n,99,')
+    size = path.stat().st_size
+    expected = [n for chunk in iter_number_chunks(str(path)) for n in chunk]
+    data = path.read_bytes()
+    for num_ranges in range(1, size + 3):
+        ranges = csv_byte_ranges(str(path), num_ranges)
+        assert 1 <= len(ranges) <= num_ranges
+        assert ranges[0][0] == 0 and ranges[-1][1] == size
+        for (_, end), (start, _) in zip(ranges, ranges[1:]):
+            # Contiguous, and every cut falls just past a delimiter
+            assert end == start and data[end - 1:end] in (b',', b'\n')
+        parsed = [n for start, end in ranges for n in parse_byte_range((str(path), start, end))]
+        assert parsed == expected
+
+def test_csv_byte_ranges_of_empty_file(tmp_path):
+    path = tmp_path / 'empty.csv'
+    path.write_bytes(b'')
+    assert csv_byte_ranges(str(path), 4) == []
+
+def test_parse_csv_parallel_joins_ranges_in_file_order(tmp_path, monkeypatch):
+    path = tmp_path / 'numbers.csv'
+    numbers = write_numbers(path)
+    # Small ranges so that even this file is split across the workers
+    monkeypatch.setattr(dataset, 'MIN_PARSE_RANGE', 1 << 10)
+    assert list(parse_csv_parallel(str(path), workers=3)) == numbers
+    assert list(parse_csv_parallel(str(path), workers=1)) == numbers
+
+def test_iter_csv_chunks_parallel_carries_leftovers_across_windows(tmp_path, monkeypatch):
+    path = tmp_path / 'numbers.csv'
+    numbers = write_numbers(path)
+    monkeypatch.setattr(dataset, 'MIN_PARSE_RANGE', 1 << 10)
+    chunks = list(iter_csv_chunks_parallel(str(path), chunk_size=1000, workers=2, window_size=1 << 14))
+    assert [len(chunk) for chunk in chunks] == [1000, 1000, 1000]
+    assert [n for chunk in chunks for n in chunk] == numbers
@@ -0,0 +1,115 @@
+"""
+Checks the shared scheduling helpers in parallel.py.
+Run with: python -m pytest -q
+"""
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+from parallel import BoundedExecutor, balanced_ranges, count_deduplicated, make_balanced_tasks, unique_with_counts
+from prime_core import count_primes_in_chunk_weighted, is_prime
+from primality import trial_division_cost
+
+def assert_partition(ranges, length):
+    """ranges are non-empty, contiguous and cover 0..length in order."""
+    assert ranges[0][0] == 0 and ranges[-1][1] == length
+    for start, stop in ranges:
+        assert start < stop
+    for (_, stop), (start, _) in zip(ranges, ranges[1:]):
+        assert stop == start
+
+def test_balanced_ranges_partition_the_input():
+    numbers = list(range(1000))
+    for num_tasks in (1, 2, 3, 7, 64, 999, 1000, 5000):
+        ranges = balanced_ranges(numbers, num_tasks)
+        assert 1 <= len(ranges) <= min(num_tasks, len(numbers))
+        assert_partition(ranges, len(numbers))
+
+def test_balanced_ranges_of_nothing():
+    assert balanced_ranges([], 8) == []
+
+def test_balanced_ranges_give_expensive_values_fewer_items():
+    # Cheap small values first, then values whose trial division costs far more
+    numbers = [10] * 10000 + [10**11 + 3] * 10000
+    ranges = balanced_ranges(numbers, 8)
+    assert_partition(ranges, len(numbers))
+    sizes = [stop - start for start, stop in ranges]
+    assert sizes[0] > 2 * max(sizes[1:])
+
+def test_balanced_ranges_even_out_estimated_cost():
+    rng = random.Random(3)
+    numbers = sorted(rng.randrange(2, 1 << 40) for _ in range(20000))
+    ranges = balanced_ranges(numbers, 8)
+    costs = [sum(trial_division_cost(1, n) for n in numbers[start:stop]) for start, stop in ranges]
+    assert len(ranges) == 8
+    assert max(costs) < 2 * min(costs)
+
+def repetitive_numbers():
+    rng = random.Random(11)
+    pool = [rng.randrange(-10, 1 << 40) for _ in range(300)] + [2, 3, (1 << 61) - 1]
+    return [rng.choice(pool) for _ in range(5000)]
+
+def test_unique_with_counts(numpy_mode):
+    numbers = repetitive_numbers()
+    values, counts = unique_with_counts(numbers)
+    expected = Counter(numbers)
+    assert list(values) == sorted(expected)
+    assert list(counts) == [expected[n] for n in sorted(expected)]
+
+def test_unique_with_counts_of_nothing(numpy_mode):
+    values, counts = unique_with_counts([])
+    assert len(values) == len(counts) == 0
+
+@pytest.mark.parametrize('executor_type', [ThreadPoolExecutor, ProcessPoolExecutor])
+def test_count_deduplicated_weights_each_prime_by_its_multiplicity(executor_type):
+    numbers = repetitive_numbers()
+    with executor_type(max_workers=2) as executor:
+        for num_tasks in (1, 3, 16):
+            primes = count_deduplicated(executor, count_primes_in_chunk_weighted, numbers, num_tasks)
+            assert primes == sum(is_prime(n) for n in numbers)
+
+def test_make_balanced_tasks_slices_in_order():
+    numbers = list(range(500))
+    tasks = make_balanced_tasks(numbers, 6)
+    assert [n for task in tasks for n in task] == numbers
+
+def test_bounded_executor_limits_concurrency_without_blocking_submit():
+    running = 0
+    peak = 0
+    lock = threading.Lock()
+    release = threading.Event()
+
+    def task(i):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        release.wait()
+        with lock:
+            running -= 1
+        return i
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        executor = BoundedExecutor(pool, 2)
+        start = time.perf_counter()
+        futures = [executor.submit(task, i) for i in range(10)]
+        # Every task is accepted at once even though only two may run
+        assert time.perf_counter() - start < 1.0
+        release.set()
+        assert [future.result(timeout=10) for future in futures] == list(range(10))
+    assert peak == 2
+
+def test_bounded_executor_passes_exceptions_on():
+    def fail():
+        raise ValueError("boom")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        executor = BoundedExecutor(pool, 1)
+        futures = [executor.submit(fail) for _ in range(3)]
+        for future in futures:
+            with pytest.raises(ValueError, match="boom"):
+                future.result(timeout=10)
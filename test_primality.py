@@ -0,0 +1,87 @@
+"""
+Checks the primality kernels against plain trial division.
+Run with: python -m pytest -q
+"""
+import random
+
+import pytest
+
+import primality
+from prime_core import count_primes_in_chunk_numpy
+
+INT64_MAX = (1 << 63) - 1
+
+# Composites that pass Miller-Rabin for every base up to some prime:
+# the smallest strong pseudoprimes to bases 2, 2..3, 2..5, ... 2..23
+STRONG_PSEUDOPRIMES = [2047, 1373653, 25326001, 3215031751, 2152302898747, 3474749660383,
+                       341550071728321, 3825123056546413051]
+# Carmichael numbers fool the Fermat test for every coprime base
+CARMICHAEL_NUMBERS = [561, 1105, 1729, 2465, 2821, 6601, 8911]
+LARGE_PRIMES = [(1 << 31) - 1, 1000000007, (1 << 61) - 1, INT64_MAX - 24]
+
+def trial_division(n):
+    if n < 2:
+        return False
+    d = 2
+    while d * d <= n:
+        if n % d == 0:
+            return False
+        d += 1
+    return True
+
+def sample_numbers():
+    """Small values, both sides of the Miller-Rabin threshold, and tricky composites."""
+    rng = random.Random(42)
+    threshold = primality.MILLER_RABIN_THRESHOLD
+    numbers = list(range(-10, 3000))
+    numbers += [rng.randrange(threshold - 5000, threshold + 5000) for _ in range(500)]
+    numbers += [rng.randrange(2, 1 << 26) for _ in range(500)]
+    numbers += [p * p for p in (2, 3, 5, 7, 1009, 1021)] + CARMICHAEL_NUMBERS
+    rng.shuffle(numbers)
+    return numbers
+
+NUMBERS = sample_numbers()
+EXPECTED = sum(trial_division(n) for n in NUMBERS)
+
+def test_count_primes_sieve_matches_trial_division():
+    assert primality.count_primes_sieve(NUMBERS) == EXPECTED
+
+def test_weighted_sieve_matches_trial_division():
+    weights = [n % 3 + 1 for n in NUMBERS]
+    expected = sum(w for n, w in zip(NUMBERS, weights) if trial_division(n))
+    assert primality.count_primes_sieve(NUMBERS, weights) == expected
+
+def test_sieve_spans_several_segments():
+    # Values just around segment boundaries, where a sieve offset bug would show
+    segment = primality.SIEVE_SEGMENT_SIZE
+    numbers = [k * segment + d for k in (1, 2, 5) for d in range(-40, 40)]
+    assert primality.count_primes_sieve(numbers) == sum(trial_division(n) for n in numbers)
+
+def test_sieve_of_nothing_prime():
+    assert primality.count_primes_sieve([]) == 0
+    assert primality.count_primes_sieve([-7, 0, 1, 4, 9]) == 0
+
+def test_numpy_kernels_match_trial_division():
+    np = pytest.importorskip('numpy')
+    assert count_primes_in_chunk_numpy(NUMBERS) == EXPECTED
+    assert primality.count_primes_numpy(NUMBERS) == EXPECTED
+    flags = primality.prime_flags_numpy(NUMBERS + LARGE_PRIMES + STRONG_PSEUDOPRIMES)
+    expected = [trial_division(n) for n in NUMBERS] + [True] * len(LARGE_PRIMES) + [False] * len(STRONG_PSEUDOPRIMES)
+    assert np.array_equal(flags, expected)
+
+def test_numpy_kernel_of_empty_chunk():
+    pytest.importorskip('numpy')
+    assert count_primes_in_chunk_numpy([]) == 0
+    assert primality.count_primes_numpy([]) == 0
+
+@pytest.mark.parametrize('n', STRONG_PSEUDOPRIMES + CARMICHAEL_NUMBERS)
+def test_miller_rabin_rejects_pseudoprimes(n):
+    assert not primality.is_prime_miller_rabin(n)
+
+@pytest.mark.parametrize('n', LARGE_PRIMES)
+def test_miller_rabin_accepts_large_primes(n):
+    assert primality.is_prime_miller_rabin(n)
+
+def test_miller_rabin_matches_trial_division():
+    for n in range(-5, 20000):
+        assert primality.is_prime_miller_rabin(n) == trial_division(n), n
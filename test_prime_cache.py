@@ -0,0 +1,82 @@
+"""
+Checks the persistent primality cache in prime_cache.py.
+Run with: python -m pytest -q
+"""
+import random
+
+from prime_cache import PrimeCache, SLOT
+from prime_core import is_prime
+
+DENSE_LIMIT = 1 << 12
+
+class CountingIsPrime:
+    """is_prime that records which values it was asked about."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, n):
+        self.calls.append(n)
+        return is_prime(n)
+
+def sample_numbers():
+    rng = random.Random(9)
+    numbers = list(range(-5, 200)) + [DENSE_LIMIT - 1, DENSE_LIMIT, DENSE_LIMIT + 1]
+    numbers += [rng.randrange(DENSE_LIMIT, 1 << 40) for _ in range(300)] + [(1 << 61) - 1, 1 << 62]
+    return numbers
+
+def test_counts_match_and_misses_are_cached(tmp_path):
+    numbers = sample_numbers()
+    expected = sum(is_prime(n) for n in numbers)
+    cache = PrimeCache(str(tmp_path), dense_limit=DENSE_LIMIT)
+
+    first = CountingIsPrime()
+    assert cache.count_primes(numbers, first) == expected
+    # Only values above the dense bitmap ever reach is_prime
+    assert first.calls and min(first.calls) >= DENSE_LIMIT
+
+    second = CountingIsPrime()
+    assert cache.count_primes(numbers, second) == expected
+    assert second.calls == []
+    assert cache.hits == 2 * len(numbers) - len(first.calls)
+    assert cache.misses == len(first.calls)
+
+def test_results_and_counters_persist_across_instances(tmp_path):
+    numbers = sample_numbers()
+    expected = sum(is_prime(n) for n in numbers)
+    first = CountingIsPrime()
+    PrimeCache(str(tmp_path), dense_limit=DENSE_LIMIT).count_primes(numbers, first)
+
+    reopened = PrimeCache(str(tmp_path), dense_limit=DENSE_LIMIT)
+    calls = CountingIsPrime()
+    assert reopened.count_primes(numbers, calls) == expected
+    assert calls.calls == []
+    assert reopened.stats() == {"hits": 2 * len(numbers) - len(first.calls), "misses": len(first.calls)}
+
+def test_colliding_values_evict_but_stay_correct(tmp_path):
+    # Four slots for hundreds of values: most inserts evict another entry
+    cache = PrimeCache(str(tmp_path), dense_limit=DENSE_LIMIT, capacity=4)
+    rng = random.Random(5)
+    numbers = [rng.randrange(DENSE_LIMIT, 1 << 30) for _ in range(500)]
+    expected = sum(is_prime(n) for n in numbers)
+    assert cache.count_primes(numbers, is_prime) == expected
+    assert cache.count_primes(numbers, is_prime) == expected
+
+def test_torn_slot_is_recomputed(tmp_path):
+    cache = PrimeCache(str(tmp_path), dense_limit=DENSE_LIMIT)
+    n = (1 << 61) - 1
+    cache.count_primes([n], is_prime)
+    # A value whose tag does not match either salt is treated as empty
+    SLOT.pack_into(cache._sparse, cache._slot_offset(n), n, 12345)
+    calls = CountingIsPrime()
+    assert cache.count_primes([n], calls) == 1
+    assert calls.calls == [n]
+
+def test_dense_bitmap_is_rebuilt_for_a_larger_limit(tmp_path):
+    PrimeCache(str(tmp_path), dense_limit=DENSE_LIMIT)
+    larger = PrimeCache(str(tmp_path), dense_limit=4 * DENSE_LIMIT)
+    assert larger.dense_limit == 4 * DENSE_LIMIT
+    calls = CountingIsPrime()
+    numbers = list(range(DENSE_LIMIT, 4 * DENSE_LIMIT))
+    assert larger.count_primes(numbers, calls) == sum(is_prime(n) for n in numbers)
+    assert calls.calls == []
@@ -0,0 +1,29 @@
+"""
+Checks building and querying the on-disk prime index in prime_index.py.
+Run with: python -m pytest -q
+"""
+import random
+
+from prime_core import is_prime
+from prime_index import PrimeIndex, build_index
+
+INT64_MAX = (1 << 63) - 1
+
+def test_prime_index_range_and_top(tmp_path, numpy_mode):
+    rng = random.Random(7)
+    numbers = [rng.randrange(-50, 5000) for _ in range(20000)] + [INT64_MAX - 24] * 3
+    path = str(tmp_path / 'primes.idx')
+    primes = [n for n in numbers if is_prime(n)]
+    assert build_index(numbers, path) == (len(set(primes)), len(primes))
+
+    with PrimeIndex(path) as index:
+        assert len(index) == len(set(primes))
+        for low, high in [(0, 10), (2, 2), (4, 4), (-100, 100), (1000, 4999), (3000, 2000), (0, INT64_MAX)]:
+            in_range = [p for p in primes if low <= p <= high]
+            assert index.count_range(low, high) == len(in_range)
+            assert index.count_range(low, high, distinct=True) == len(set(in_range))
+        ranked = sorted(set(primes), reverse=True)
+        for k in (0, 1, 5, len(ranked), len(ranked) + 3):
+            assert index.top(k) == [(p, primes.count(p)) for p in ranked[:k]]
+        assert INT64_MAX - 24 in index and index.count(INT64_MAX - 24) == 3
+        assert 4 not in index
@@ -0,0 +1,60 @@
+"""
+Checks message framing and header validation in protocol.py.
+Run with: python -m pytest -q
+"""
+import asyncio
+import socket
+
+import pytest
+
+from protocol import (HEADER, MAX_PAYLOAD, MESSAGE_TYPES, MSG_RESULT, MSG_WORK, UNIT, pack_numbers, pack_result,
+                      read_message, recv_message, send_message, unpack_header, unpack_numbers, unpack_result,
+                      unpack_work)
+
+@pytest.mark.parametrize('msg_type', sorted(MESSAGE_TYPES))
+def test_unpack_header_accepts_known_types(msg_type):
+    assert unpack_header(HEADER.pack(msg_type, 12)) == (msg_type, 12)
+
+@pytest.mark.parametrize('msg_type', [0, max(MESSAGE_TYPES) + 1, 255])
+def test_unpack_header_rejects_unknown_types(msg_type):
+    with pytest.raises(ValueError, match="Unknown message type"):
+        unpack_header(HEADER.pack(msg_type, 0))
+
+def test_unpack_header_enforces_max_payload():
+    assert unpack_header(HEADER.pack(MSG_WORK, MAX_PAYLOAD)) == (MSG_WORK, MAX_PAYLOAD)
+    with pytest.raises(ValueError, match="exceeds"):
+        unpack_header(HEADER.pack(MSG_WORK, MAX_PAYLOAD + 1))
+    with pytest.raises(ValueError, match="exceeds"):
+        unpack_header(HEADER.pack(MSG_WORK, (1 << 64) - 1))
+
+def test_send_and_receive_a_message_in_parts():
+    left, right = socket.socketpair()
+    with left, right:
+        numbers = [-(1 << 63), 0, (1 << 63) - 1]
+        sent = send_message(left, MSG_WORK, UNIT.pack(7), pack_numbers(numbers))
+        msg_type, payload = recv_message(right)
+        assert sent == HEADER.size + len(payload)
+        unit_id, encoded = unpack_work(payload)
+        assert (msg_type, unit_id, list(unpack_numbers(encoded))) == (MSG_WORK, 7, numbers)
+
+def test_oversized_message_is_rejected_before_its_payload_is_read():
+    left, right = socket.socketpair()
+    with left, right:
+        # Only the header is sent; reading the payload would block forever
+        left.sendall(HEADER.pack(MSG_WORK, MAX_PAYLOAD + 1))
+        right.settimeout(5)
+        with pytest.raises(ValueError):
+            recv_message(right)
+
+def test_read_message_from_an_asyncio_stream():
+    async def exchange():
+        reader = asyncio.StreamReader()
+        reader.feed_data(HEADER.pack(MSG_RESULT, 24) + pack_result(3, 42, 1.5))
+        reader.feed_data(HEADER.pack(200, 0))
+        reader.feed_eof()
+        msg_type, payload = await read_message(reader)
+        assert (msg_type, unpack_result(payload)) == (MSG_RESULT, (3, 42, 1.5))
+        with pytest.raises(ValueError, match="Unknown message type"):
+            await read_message(reader)
+
+    asyncio.run(exchange())
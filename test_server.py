@@ -0,0 +1,131 @@
+"""
+Checks the server's WorkQueue: hand-out order, straggler reassignment,
+duplicate results and requeueing after a client leaves.
+Run with: python -m pytest -q
+"""
+import asyncio
+import time
+
+import pytest
+
+import server
+from server import WorkQueue
+
+UNITS = [[2, 3, 4], [5, 6], [7]]
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, 10))
+
+def test_units_are_handed_out_once_each_until_finished():
+    async def job():
+        queue = WorkQueue(UNITS)
+        for expected_id, unit in enumerate(UNITS):
+            unit_id, numbers = await queue.get(1)
+            assert (unit_id, list(numbers)) == (expected_id, unit)
+            assert await queue.complete(1, unit_id, len(unit), 0.1)
+        await asyncio.wait_for(queue.finished.wait(), 5)
+        assert await queue.get(1) is None
+        assert queue.results == {i: (len(unit), 0.1) for i, unit in enumerate(UNITS)}
+        assert (queue.reassigned, queue.duplicates) == (0, 0)
+
+    run(job())
+
+def test_empty_source_is_finished_at_once():
+    async def job():
+        queue = WorkQueue([])
+        assert queue.finished.is_set()
+        assert await queue.get(1) is None
+
+    run(job())
+
+def test_overdue_unit_goes_to_an_idle_client_and_the_late_result_is_discarded():
+    async def job():
+        queue = WorkQueue(UNITS[:1], unit_timeout=0.05)
+        assert (await queue.get(1))[0] == 0
+        # Client 2 has nothing new to take, so it waits for unit 0's deadline
+        assert (await queue.get(2))[0] == 0
+        assert queue.reassigned == 1
+        assert await queue.complete(2, 0, 3, 0.2)
+        assert not await queue.complete(1, 0, 3, 0.9)
+        assert queue.duplicates == 1
+        assert queue.results == {0: (3, 0.2)}
+        await asyncio.wait_for(queue.finished.wait(), 5)
+
+    run(job())
+
+def test_a_client_is_not_reassigned_its_own_unit():
+    async def job():
+        queue = WorkQueue(UNITS[:1], unit_timeout=0.01)
+        await queue.get(1)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(queue.get(1), 0.2)
+
+    run(job())
+
+def test_released_unit_is_requeued_for_the_next_client():
+    async def job():
+        queue = WorkQueue(UNITS[:2])
+        assert (await queue.get(1))[0] == 0
+        await queue.release(1, 0)
+        # The requeued unit comes before units not handed out yet
+        unit_id, numbers = await queue.get(2)
+        assert (unit_id, list(numbers)) == (0, UNITS[0])
+        assert queue.reassigned == 0
+        assert (await queue.get(2))[0] == 1
+
+    run(job())
+
+def test_unit_still_held_elsewhere_is_not_requeued():
+    async def job():
+        queue = WorkQueue(UNITS[:1], unit_timeout=0.01)
+        await queue.get(1)
+        await queue.get(2)
+        await queue.release(1, 0)
+        assert not queue._pending
+        assert await queue.complete(2, 0, 3, 0.1)
+        await asyncio.wait_for(queue.finished.wait(), 5)
+
+    run(job())
+
+def test_waiting_client_is_woken_by_a_requeue():
+    async def job():
+        queue = WorkQueue(UNITS[:1])
+        await queue.get(1)
+        waiter = asyncio.ensure_future(queue.get(2))
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        await queue.release(1, 0)
+        assert (await waiter)[0] == 0
+
+    run(job())
+
+def test_slow_source_does_not_stall_the_event_loop():
+    def slow_units():
+        for unit in UNITS:
+            yield unit
+            time.sleep(0.3)
+
+    async def job():
+        queue = WorkQueue(slow_units())
+        assert (await queue.get(1))[0] == 0
+        # The next unit is still being read, yet results go through at once
+        start = time.perf_counter()
+        assert await queue.complete(1, 0, 2, 0.1)
+        await asyncio.sleep(0.01)
+        assert time.perf_counter() - start < 0.2
+        assert (await queue.get(2))[0] == 1
+        assert queue.read_time >= 0.3
+
+    run(job())
+
+def test_deadline_follows_the_median_unit_time():
+    async def job():
+        queue = WorkQueue(UNITS)
+        assert queue.deadline() == server.FIRST_UNIT_TIMEOUT
+        queue._unit_times = [10.0, 20.0, 30.0]
+        assert queue.deadline() == server.STRAGGLER_FACTOR * 20.0
+        queue._unit_times = [0.01]
+        assert queue.deadline() == server.MIN_UNIT_TIMEOUT
+        assert WorkQueue(UNITS, unit_timeout=1.5).deadline() == 1.5
+
+    run(job())